@@ -16,9 +16,13 @@ import aiohttp
 import aiofiles
 from config import (
     DISCORD_TOKEN, OPENAI_API_KEY, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME,
-    ALLOWED_ROLES, MODEL, MAX_TOKEN_LIMIT, MAX_MESSAGES, ENABLE_SUMMARIES, SUMMARY_PROMPT, MAX_HISTORY_DAYS, SYSTEM_INSTRUCTIONS, BATCH_SIZE, IMAGE_ANALYSIS_SYSTEM_PROMPT, GREETING_SYSTEM_PROMPT
+    ALLOWED_ROLES, MODEL, MAX_TOKEN_LIMIT, MAX_MESSAGES, ENABLE_SUMMARIES, SUMMARY_PROMPT, MAX_HISTORY_DAYS, SYSTEM_INSTRUCTIONS, BATCH_SIZE, IMAGE_ANALYSIS_SYSTEM_PROMPT, GREETING_SYSTEM_PROMPT,
+    SPECULATIVE_CHAT, MEMORY_FLUSH_INTERVAL, SUMMARY_BACKLOG_MESSAGES, SUMMARY_WORKERS, CONTEXT_TOKEN_BUDGET
 )
+from session_cache import SessionCache, UserSession
+from context_builder import pack_history, count_prompt_tokens
 import signal
+from reminders.db import ensure_reminder_schema
 import reminders.reminder_handler as reminder_handler  # Add this import at the top
 import reminders.scheduler as reminder_scheduler
 import reminders.time_handler as reminder_time_handler
@@ -27,9 +31,10 @@ import time
 
 # --- Globals and State ---
 BOT_ROLES = set()
-memory_cache = {}
-message_history_cache = {}
-conversation_summaries = {}
+# Per-user memory buffer, message history and summary, bounded by SESSION_CACHE_MAX_USERS/SESSION_CACHE_MAX_BYTES
+session_cache = SessionCache(flush=lambda user_id, session: write_session(user_id, session))
+# user_id -> task loading that user's session, so concurrent first loads share one UserSession
+session_loads = {}
 
 MAIN_EVENT_LOOP = None  # <-- Add this global
 
@@ -37,94 +42,158 @@ MAIN_EVENT_LOOP = None  # <-- Add this global
 def create_new_memory():
     return ChatMemoryBuffer.from_defaults(token_limit=MAX_TOKEN_LIMIT)
 
-async def get_memory(user_id):
-    global memory_cache, message_history_cache, conversation_summaries, db_pool
-    if user_id not in message_history_cache:
-        message_history_cache[user_id] = []
-    if user_id not in conversation_summaries:
-        conversation_summaries[user_id] = ""
-    if user_id in memory_cache:
-        return memory_cache[user_id]
+def get_history(user_id):
+    """The user's cached message history (empty if their session isn't loaded)"""
+    session = session_cache.peek(user_id)
+    return session.messages if session else []
+
+def get_summary(user_id):
+    """The user's cached conversation summary"""
+    session = session_cache.peek(user_id)
+    return session.summary if session else ""
+
+async def load_session(user_id):
+    """Return the user's session, loading it from conversation_messages on a cache miss"""
+    session = session_cache.get(user_id)
+    if session is not None:
+        return session
+    # The speculative reply and the main path can both miss on a user's first message
+    load = session_loads.get(user_id)
+    if load is None:
+        load = asyncio.ensure_future(read_session(user_id))
+        session_loads[user_id] = load
+        load.add_done_callback(lambda _: session_loads.pop(user_id, None) if session_loads.get(user_id) is load else None)
+    # Shielded so a cancelled caller doesn't cancel the load the other one is waiting on
+    return await asyncio.shield(load)
+
+async def read_session(user_id):
+    session = UserSession(create_new_memory())
     try:
         async with reminders.db_pool.db_pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                await cursor.execute("SELECT memory_json FROM user_threads WHERE user_id = %s", (user_id,))
-                result = await cursor.fetchone()
-                if result and result[0]:
-                    try:
-                        data = json.loads(result[0])
-                        if isinstance(data, dict) and "messages" in data and "summary" in data:
-                            message_history_cache[user_id] = data["messages"]
-                            conversation_summaries[user_id] = data["summary"]
-                        else:
-                            message_history_cache[user_id] = data
-                            conversation_summaries[user_id] = ""
-                        print(f"Loaded message history for user {user_id} from database")
-                    except Exception as e:
-                        print(f"Could not parse message history from database for user {user_id}: {e}")
-                        message_history_cache[user_id] = []
-                        conversation_summaries[user_id] = ""
-                    memory = create_new_memory()
-                else:
-                    memory = create_new_memory()
-                    message_history_cache[user_id] = []
-                    conversation_summaries[user_id] = ""
-                memory_cache[user_id] = memory
-                return memory
+                # One primary-key range scan: seq 0 is the summary row, then the messages in order
+                await cursor.execute("SELECT seq, role, content FROM conversation_messages WHERE user_id = %s ORDER BY seq", (user_id,))
+                for seq, role, content in await cursor.fetchall():
+                    if seq == 0:
+                        session.summary = content or ""
+                        session.saved_summary = session.summary
+                        continue
+                    msg = {"role": role, "content": content}
+                    session.messages.append(msg)
+                    session.saved[id(msg)] = (msg, seq)
+                    session.next_seq = seq + 1
+                if session.messages:
+                    print(f"Loaded message history for user {user_id} from database")
     except Exception as e:
         print(f"❌ Error retrieving memory: {e}")
-        memory = create_new_memory()
-        memory_cache[user_id] = memory
-        message_history_cache[user_id] = []
-        conversation_summaries[user_id] = ""
-        return memory
+        session = UserSession(create_new_memory())
+    await session_cache.put(user_id, session)
+    return session
+
+async def get_memory(user_id):
+    session = await load_session(user_id)
+    return session.memory
 
 async def manage_conversation_history(user_id, new_message):
-    global message_history_cache, conversation_summaries
-    message_history_cache[user_id].append(new_message)
-    # Batch summarization: summarize and remove BATCH_SIZE oldest messages at once
-    while len(message_history_cache[user_id]) > MAX_MESSAGES:
-        if ENABLE_SUMMARIES and len(message_history_cache[user_id]) > BATCH_SIZE:
-            # Get the batch of oldest messages
-            batch = message_history_cache[user_id][:BATCH_SIZE]
-            # Prepare summary text
-            if conversation_summaries[user_id]:
-                summary_text = f"Previous summary: {conversation_summaries[user_id]}\n\nBatch of oldest messages:\n"
-            else:
-                summary_text = "Batch of oldest messages:\n"
-            for msg in batch:
-                summary_text += f"{msg['role']}: {msg['content']}\n"
-            try:
-                response = await asyncio.to_thread(
-                    client.chat.completions.create,
-                    model=MODEL,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that summarizes conversations concisely."},
-                        {"role": "user", "content": f"{SUMMARY_PROMPT}\n\n{summary_text}"}
-                    ],
-                    temperature=0.7,
-                    max_tokens=200
-                )
-                new_summary = response.choices[0].message.content
-                conversation_summaries[user_id] = new_summary
-                print(f"[BATCH SUMMARY] Summarized and removed {BATCH_SIZE} messages for user {user_id}.")
-                print(f"[BATCH SUMMARY] New summary: {new_summary[:80]}...")
-                # Log token usage for summary
-                if hasattr(response, 'usage'):
-                    await log_token_usage(user_id, MODEL, response.usage.prompt_tokens, response.usage.completion_tokens, response.usage.total_tokens)
-            except Exception as e:
-                print(f"❌ Error updating batch summary: {e}")
+    session = await load_session(user_id)
+    history = session.messages
+    history.append(new_message)
+    if len(history) > MAX_MESSAGES:
+        if ENABLE_SUMMARIES:
+            # Summarized in the background; until then replies see the current summary and a slightly longer history
+            schedule_summary(user_id)
+        else:
+            while len(history) > MAX_MESSAGES:
+                del history[:BATCH_SIZE]
+                print(f"Removed {BATCH_SIZE} oldest messages to maintain cap of {MAX_MESSAGES} messages (batch mode)")
+    await session_cache.update(user_id)
+
+# --- Background Summarization ---
+summary_queue = asyncio.Queue()
+summary_pending = set()
+
+def schedule_summary(user_id):
+    """Queue a summarization job for the user unless one is already waiting"""
+    if user_id in summary_pending:
+        return
+    summary_pending.add(user_id)
+    summary_queue.put_nowait(user_id)
+
+async def summarize_history(user_id):
+    """Fold the oldest BATCH_SIZE messages into the summary until history is back under MAX_MESSAGES"""
+    session = session_cache.peek(user_id) or await load_session(user_id)
+    while len(session.messages) > MAX_MESSAGES:
+        # Get the batch of oldest messages
+        batch = session.messages[:BATCH_SIZE]
+        # Prepare summary text
+        if session.summary:
+            summary_text = f"Previous summary: {session.summary}\n\nBatch of oldest messages:\n"
+        else:
+            summary_text = "Batch of oldest messages:\n"
+        for msg in batch:
+            summary_text += f"{msg['role']}: {msg['content']}\n"
+        new_summary = None
+        try:
+            response = await asyncio.to_thread(
+                client.chat.completions.create,
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that summarizes conversations concisely."},
+                    {"role": "user", "content": f"{SUMMARY_PROMPT}\n\n{summary_text}"}
+                ],
+                temperature=0.7,
+                max_tokens=200
+            )
+            new_summary = response.choices[0].message.content
+            # Log token usage for summary
+            if hasattr(response, 'usage'):
+                await log_token_usage(user_id, MODEL, response.usage.prompt_tokens, response.usage.completion_tokens, response.usage.total_tokens)
+        except Exception as e:
+            print(f"❌ Error updating batch summary: {e}")
+        # Apply only if the batch is still at the front (history may have been trimmed or reset meanwhile);
+        # there is no await between this check and the update, so replies never see half of it
+        current = session.messages[:len(batch)]
+        if len(current) != len(batch) or any(a is not b for a, b in zip(current, batch)):
+            print(f"[BATCH SUMMARY] History for user {user_id} changed during summarization; retrying")
+            continue
+        if new_summary is not None:
+            session.summary = new_summary
+            print(f"[BATCH SUMMARY] Summarized and removed {len(batch)} messages for user {user_id}.")
+            print(f"[BATCH SUMMARY] New summary: {new_summary[:80]}...")
         # Remove the batch from history
-        del message_history_cache[user_id][:BATCH_SIZE]
-        print(f"Removed {BATCH_SIZE} oldest messages to maintain cap of {MAX_MESSAGES} messages (batch mode)")
+        del session.messages[:len(batch)]
+        print(f"Removed {len(batch)} oldest messages to maintain cap of {MAX_MESSAGES} messages (batch mode)")
+        await session_cache.update(user_id)
+
+async def summary_worker():
+    while True:
+        user_id = await summary_queue.get()
+        try:
+            await summarize_history(user_id)
+        except Exception as e:
+            print(f"❌ Error summarizing history for user {user_id}: {e}")
+        finally:
+            summary_pending.discard(user_id)
+            summary_queue.task_done()
 
 async def save_memory(user_id, memory):
-    global memory_cache, message_history_cache, conversation_summaries, db_pool
-    memory_cache[user_id] = memory
-    while len(message_history_cache[user_id]) > MAX_MESSAGES:
-        message_history_cache[user_id].pop(0)
-        print(f"Enforcing strict message limit of {MAX_MESSAGES} before saving")
-    for msg in message_history_cache[user_id]:
+    """Trim the user's session and queue it for the next write-behind flush"""
+    session = await load_session(user_id)
+    session.memory = memory
+    trim_session(session)
+    await session_cache.update(user_id)
+
+def trim_session(session):
+    """Cap a session's history and strip inline image data.
+
+    With summaries on, up to SUMMARY_BACKLOG_MESSAGES extra messages are kept
+    while the background summarizer catches up.
+    """
+    limit = MAX_MESSAGES + (SUMMARY_BACKLOG_MESSAGES if ENABLE_SUMMARIES else 0)
+    while len(session.messages) > limit:
+        session.messages.pop(0)
+        print(f"Enforcing strict message limit of {limit} before saving")
+    for msg in session.messages:
         if isinstance(msg.get("content"), list):
             for item in msg["content"]:
                 if isinstance(item, dict) and item.get("type") == "text":
@@ -134,47 +203,106 @@ async def save_memory(user_id, memory):
                     msg["content"] = "[Content removed due to size]"
         if isinstance(msg.get("content"), str) and "base64" in msg.get("content", ""):
             msg["content"] = msg["content"].split("base64,")[0] + "base64,[IMAGE DATA REMOVED]"
-    memory_data = {
-        "messages": message_history_cache[user_id],
-        "summary": conversation_summaries[user_id]
-    }
-    memory_json = json.dumps(memory_data)
-    data_size_kb = len(memory_json) / 1024
-    print(f"Memory size for user {user_id}: {data_size_kb:.2f} KB")
-    MAX_MEMORY_SIZE_KB = 250
-    if data_size_kb > MAX_MEMORY_SIZE_KB:
-        print(f"⚠️ Memory size exceeds limit ({data_size_kb:.2f}KB > {MAX_MEMORY_SIZE_KB}KB). Trimming conversation.")
-        message_history_cache[user_id] = [{"role": "user", "content": "Let's continue our conversation."}]
-        conversation_summaries[user_id] = "Previous conversation was too large and had to be reset."
-        memory_data = {
-            "messages": message_history_cache[user_id],
-            "summary": conversation_summaries[user_id]
-        }
-        memory_json = json.dumps(memory_data)
-        data_size_kb = len(memory_json) / 1024
-        print(f"Reduced memory size for user {user_id}: {data_size_kb:.2f} KB")
+
+async def write_sessions(sessions):
+    """Append new messages, range-delete trimmed ones and update changed summaries for several users.
+
+    Only the difference from what conversation_messages already holds is
+    written. A session changed again while its write was in flight stays
+    dirty for the next flush. Writes of the same session never overlap: a
+    second one (e.g. an eviction during a periodic flush) waits for the first,
+    so it plans its rows from the updated saved state.
+    """
+    if not sessions:
+        return
+    while True:
+        in_flight = [session.writing for _, session in sessions if session.writing is not None]
+        if not in_flight:
+            break
+        await asyncio.gather(*(event.wait() for event in in_flight))
+    # No awaits between the check above and claiming the sessions here
+    for _, session in sessions:
+        session.writing = asyncio.Event()
+    try:
+        await _write_sessions(sessions)
+    finally:
+        for _, session in sessions:
+            event, session.writing = session.writing, None
+            event.set()
+
+async def _write_sessions(sessions):
+    plans = []
+    for user_id, session in sessions:
+        trim_session(session)
+        kept = []
+        new_rows = []
+        next_seq = session.next_seq
+        for msg in session.messages:
+            entry = session.saved.get(id(msg))
+            if entry is not None and entry[0] is msg:
+                kept.append((msg, entry[1]))
+            else:
+                content = msg.get("content")
+                if not isinstance(content, str):
+                    content = json.dumps(content)
+                new_rows.append((user_id, next_seq, msg.get("role", "user"), content))
+                kept.append((msg, next_seq))
+                next_seq += 1
+        # History only ever loses messages from the front, so dropped rows are one seq range
+        delete_below = None
+        if len(kept) - len(new_rows) < len(session.saved):
+            delete_below = kept[0][1] if kept else next_seq
+        summary = session.summary if session.summary != session.saved_summary else None
+        plans.append((user_id, session, session.version, kept, new_rows, delete_below, summary, next_seq))
+    if not any(plan[4] or plan[5] is not None or plan[6] is not None for plan in plans):
+        for _, session, version, *_ in plans:
+            if session.version == version:
+                session.dirty = False
+        return
     try:
         async with reminders.db_pool.db_pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute("SELECT 1 FROM user_threads WHERE user_id = %s", (user_id,))
-                exists = await cursor.fetchone()
-                if exists:
-                    query = """
-                    UPDATE user_threads 
-                    SET memory_json = %s, last_used = NOW()
-                    WHERE user_id = %s
-                    """
-                    await cursor.execute(query, (memory_json, user_id))
-                else:
-                    query = """
-                    INSERT INTO user_threads (user_id, memory_json) VALUES (%s, %s)
-                    """
-                    await cursor.execute(query, (user_id, memory_json))
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    for user_id, _, _, _, new_rows, delete_below, summary, _ in plans:
+                        if delete_below is not None:
+                            await cursor.execute(
+                                "DELETE FROM conversation_messages WHERE user_id = %s AND seq >= 1 AND seq < %s",
+                                (user_id, delete_below)
+                            )
+                        if new_rows:
+                            await cursor.executemany(
+                                "INSERT INTO conversation_messages (user_id, seq, role, content) VALUES (%s, %s, %s, %s)",
+                                new_rows
+                            )
+                        if summary is not None:
+                            await cursor.execute("""
+                            INSERT INTO conversation_messages (user_id, seq, role, content) VALUES (%s, 0, 'summary', %s)
+                            ON DUPLICATE KEY UPDATE content = VALUES(content)
+                            """, (user_id, summary))
                 await conn.commit()
-                print(f"✅ Saved memory for user {user_id}")
+            except Exception:
+                await conn.rollback()
+                raise
+        for user_id, session, version, kept, new_rows, delete_below, summary, next_seq in plans:
+            session.saved = {id(msg): (msg, seq) for msg, seq in kept}
+            session.next_seq = next_seq
+            if summary is not None:
+                session.saved_summary = summary
+            if session.version == version:
+                session.dirty = False
+        print(f"✅ Saved memory for {len(plans)} user(s)")
     except Exception as e:
         print(f"❌ Failed to save memory: {e}")
 
+async def write_session(user_id, session):
+    """Write one session to conversation_messages (used when it is evicted from the cache)"""
+    await write_sessions([(user_id, session)])
+
+async def flush_dirty_sessions():
+    """Write every session with unsaved changes"""
+    await write_sessions(session_cache.dirty_sessions())
+
 # --- Database and Bot Setup ---
 async def create_db_connection():
     try:
@@ -289,6 +417,24 @@ async def ensure_token_tracking_table():
                     print("✅ Token tracking table created")
                 else:
                     print("✅ Token tracking table already exists")
+                await cursor.execute("SHOW TABLES LIKE 'conversation_messages'")
+                messages_exist = await cursor.fetchone()
+                if not messages_exist:
+                    # Conversation memory, one row per message; seq 0 holds the running summary
+                    await cursor.execute("""
+                    CREATE TABLE conversation_messages (
+                        user_id VARCHAR(255) NOT NULL,
+                        seq BIGINT NOT NULL,
+                        role VARCHAR(32) NOT NULL,
+                        content MEDIUMTEXT,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (user_id, seq)
+                    )
+                    """)
+                    await conn.commit()
+                    print("✅ Conversation messages table created")
+                else:
+                    print("✅ Conversation messages table already exists")
                 await cursor.execute("SHOW TABLES LIKE 'user_lookup'")
                 user_lookup_exists = await cursor.fetchone()
                 if not user_lookup_exists:
@@ -335,27 +481,27 @@ async def update_bot_roles():
     return BOT_ROLES
 
 # --- Background Tasks ---
+async def flush_memory_periodically():
+    # Write-behind: several quick turns from one user become a single upsert
+    while True:
+        await asyncio.sleep(MEMORY_FLUSH_INTERVAL)
+        try:
+            await flush_dirty_sessions()
+        except Exception as e:
+            print(f"⚠️ Error flushing conversation memory: {e}")
+
 async def reset_memory_cache():
-    global memory_cache, db_pool
     while True:
         await asyncio.sleep(3600)
         try:
-            async with reminders.db_pool.db_pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    query = """
-                    SELECT user_id FROM user_threads 
-                    WHERE last_used < NOW() - INTERVAL 24 HOUR
-                    """
-                    await cursor.execute(query)
-                    results = await cursor.fetchall()
-                    if results:
-                        for user_id in results:
-                            user_id = user_id[0]
-                            if user_id in memory_cache:
-                                del memory_cache[user_id]
-                                print(f"🧹 ✅ Removed cached memory for inactive user {user_id}.")
-                    else:
-                        print("🔍 No stale memory cache entries found.")
+            removed = await session_cache.evict_idle()
+            stats = session_cache.stats()
+            if removed:
+                print(f"🧹 ✅ Removed cached sessions for {removed} inactive users.")
+            else:
+                print("🔍 No stale memory cache entries found.")
+            print(f"📊 Session cache: {stats['users']} users, {stats['bytes'] / 1024:.0f} KB, "
+                  f"{stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%}), {stats['evictions']} evictions")
         except Exception as e:
             print(f"⚠️ Error during memory cache cleanup: {e}")
 
@@ -364,6 +510,10 @@ async def cleanup_oversized_memory():
     try:
         async with reminders.db_pool.db_pool.acquire() as conn:
             async with conn.cursor() as cursor:
+                # Legacy memory_json blobs, only read by migrate_memory_json
+                await cursor.execute("SHOW TABLES LIKE 'user_threads'")
+                if not await cursor.fetchone():
+                    return
                 query = """
                 SELECT user_id, LENGTH(memory_json)/1024 as size_kb 
                 FROM user_threads 
@@ -392,6 +542,54 @@ async def cleanup_oversized_memory():
     except Exception as e:
         print(f"❌ Failed to clean up memory: {e}")
 
+async def migrate_memory_json():
+    """Copy conversation memory from user_threads.memory_json into conversation_messages.
+
+    Users that already have rows in conversation_messages (the summary row is
+    always written) are skipped, so this is safe to run on every start.
+    """
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SHOW TABLES LIKE 'user_threads'")
+                if not await cursor.fetchone():
+                    return
+                await cursor.execute("""
+                SELECT t.user_id, t.memory_json FROM user_threads t
+                WHERE t.memory_json IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM conversation_messages m WHERE m.user_id = t.user_id)
+                """)
+                results = await cursor.fetchall()
+                migrated = 0
+                for user_id, memory_json in results:
+                    try:
+                        data = json.loads(memory_json)
+                    except Exception as e:
+                        print(f"Could not parse message history from database for user {user_id}: {e}")
+                        data = {}
+                    if isinstance(data, dict):
+                        messages, summary = data.get("messages") or [], data.get("summary") or ""
+                    else:
+                        messages, summary = data if isinstance(data, list) else [], ""
+                    rows = [(user_id, 0, "summary", summary)]
+                    for seq, msg in enumerate(messages[-MAX_MESSAGES:], start=1):
+                        if not isinstance(msg, dict):
+                            continue
+                        content = msg.get("content")
+                        rows.append((user_id, seq, msg.get("role", "user"), content if isinstance(content, str) else json.dumps(content)))
+                    await cursor.executemany(
+                        "INSERT INTO conversation_messages (user_id, seq, role, content) VALUES (%s, %s, %s, %s)",
+                        rows
+                    )
+                    await conn.commit()
+                    migrated += 1
+                if migrated:
+                    print(f"✅ Migrated conversation memory for {migrated} users to conversation_messages")
+                else:
+                    print("✅ No conversation memory left to migrate")
+    except Exception as e:
+        print(f"❌ Failed to migrate conversation memory: {e}")
+
 # --- Shutdown Handling ---
 async def close_db_connection():
     
@@ -403,6 +601,7 @@ async def close_db_connection():
 async def shutdown():
     print("⏳ Initiating shutdown...")
     if reminders.db_pool.db_pool:
+        await flush_dirty_sessions()
         await close_db_connection()  # This function should also be updated to use reminders.db_pool.db_pool if needed
     print("✅ Shutdown complete. Exiting process now...")
     os._exit(0)
@@ -437,8 +636,13 @@ async def on_ready():
     if reminders.db_pool.db_pool:
         print("✅ Async MySQL connection established.")
         await ensure_token_tracking_table()
+        await ensure_reminder_schema()
         await cleanup_oversized_memory()
+        await migrate_memory_json()
         asyncio.create_task(reset_memory_cache())
+        asyncio.create_task(flush_memory_periodically())
+        for _ in range(SUMMARY_WORKERS):
+            asyncio.create_task(summary_worker())
     else:
         print("❌ Failed to connect to async MySQL.")
         import sys
@@ -480,6 +684,9 @@ async def on_ready():
         if MAIN_EVENT_LOOP and MAIN_EVENT_LOOP.is_running():
             asyncio.run_coroutine_threadsafe(log_token_usage(user_id_unused, model, prompt_tokens, completion_tokens, total_tokens), MAIN_EVENT_LOOP)
 
+    def reminders_get_user_guild_ids(user_id):
+        return [guild.id for guild in bot.guilds if guild.get_member(int(user_id))]
+
     import reminders.reminder_handler as reminder_handler
     import reminders.scheduler as reminder_scheduler
     import reminders.time_handler as reminder_time_handler
@@ -489,6 +696,7 @@ async def on_ready():
     reminder_handler.reminders_log_token_usage = reminders_log_token_usage
     reminder_scheduler.reminders_log_token_usage = reminders_log_token_usage
     reminder_time_handler.reminders_log_token_usage = reminders_log_token_usage
+    reminder_scheduler.reminders_get_user_guild_ids = reminders_get_user_guild_ids
 
     # Start the reminder scheduler and log to the console
     reminder_scheduler.start_reminder_scheduler()
@@ -525,7 +733,7 @@ async def on_interaction(interaction):
                     
                     # Cancel the reminder
                     from reminders.db import cancel_reminder
-                    success = cancel_reminder(reminder_id, user_id)
+                    success = await cancel_reminder(reminder_id, user_id)
                     
                     if success:
                         print(f"✅ Successfully cancelled reminder {reminder_id} via persistent button")
@@ -613,6 +821,49 @@ async def send_privacy_notice(channel):
         await asyncio.sleep(1)
         await channel.send(notice)
 
+def build_chat_messages(user_id, history, user_message, user_roles_str, is_first_message):
+    """Assemble the prompt for a text reply from the system prompt, summary and history"""
+    messages = []
+    if is_first_message:
+        # Use dedicated greeting prompt instead of normal system instructions
+        messages.append({"role": "system", "content": GREETING_SYSTEM_PROMPT})
+        messages.append(user_message)
+    else:
+        messages.append({"role": "system", "content": SYSTEM_INSTRUCTIONS + user_roles_str})
+        if ENABLE_SUMMARIES and get_summary(user_id):
+            messages.append({"role": "system", "content": f"Previous conversation summary: {get_summary(user_id)}"})
+        # Newest history first until the token budget is spent, rather than a fixed message count
+        messages.extend(pack_history(history, CONTEXT_TOKEN_BUDGET - count_prompt_tokens(messages)))
+    return messages
+
+def log_speculative_usage(user_id, request):
+    if request.cancelled() or request.exception() is not None:
+        return
+    response = request.result()
+    if response.usage:
+        asyncio.ensure_future(log_token_usage(user_id, MODEL, response.usage.prompt_tokens, response.usage.completion_tokens, response.usage.total_tokens))
+
+async def speculative_chat_completion(user_id, all_content, user_roles_str):
+    """Run the text reply without touching history; the caller commits or discards it.
+
+    The request's token usage is logged here once it finishes, whether or not
+    the reply is used: to_thread can't stop a request already under way, so a
+    discarded reply is still billed.
+    """
+    await get_memory(user_id)
+    history = get_history(user_id)
+    user_message = {"role": "user", "content": all_content}
+    messages = build_chat_messages(user_id, history + [user_message], user_message, user_roles_str, len(history) == 0)
+    request = asyncio.ensure_future(asyncio.to_thread(
+        client.chat.completions.create,
+        model=MODEL,
+        messages=messages,
+        temperature=0.7
+    ))
+    request.add_done_callback(lambda done: log_speculative_usage(user_id, done))
+    response = await asyncio.shield(request)
+    return all_content, response
+
 async def handle_user_message(message):
     if message.author == bot.user:
         return
@@ -659,12 +910,12 @@ async def handle_user_message(message):
                 user_roles_str = f"\nUser Discord Role(s): {', '.join(sorted(user_roles))}"
             
             # --- LOCATION RESPONSE HANDLING ---
-            if user_id in AWAITING_LOCATION and AWAITING_LOCATION[user_id] is not None:
+            if await AWAITING_LOCATION.get(user_id) is not None:
                 # IMPORTANT: Only process if there's actual text content
                 # Otherwise, let the attachment handler process it for voice messages
                 if message.content and message.content.strip():
                     print(f"💬 Processing text location response: '{message.content}'")
-                    reminder_handler.process_location_response(message.content, user_id)
+                    await reminder_handler.process_location_response(message.content, user_id)
                     return
                 # If no content (voice message), continue to attachment handling
             # --- REMINDER INTEGRATION START ---
@@ -688,6 +939,7 @@ async def handle_user_message(message):
             reminder_time_handler.reminders_log_token_usage = reminders_log_token_usage
             # Use the message content for detection
             text = message.content.strip() if message.content else ""
+            speculative_task = None
             if text:
                 # Respond to timezone help queries (very flexible)
                 import re
@@ -698,27 +950,36 @@ async def handle_user_message(message):
                 # Respond to 'what is my timezone' queries (very flexible)
                 from reminders.db import get_user_timezone
                 if re.search(r"what('?s| is|\s+is)?\s+(my|the)?\s*time[\s-]?zone( am i in| do i have| is it)?\b", text, re.IGNORECASE):
-                    tz = get_user_timezone(user_id) or 'Not set'
+                    tz = await get_user_timezone(user_id) or 'Not set'
                     await send_with_privacy(f'🌎 **Timezone:** {tz}')
                     return
-                op_type = reminder_handler.detect_reminder_operation(text, user_id)
+                op_type = reminder_handler.detect_reminder_operation_locally(text)
+                if op_type is None:
+                    # Ambiguous message: most of these turn out to be ordinary chat, so start
+                    # the reply now and throw it away if the LLM says it was a reminder request
+                    if SPECULATIVE_CHAT and not message.attachments:
+                        speculative_task = asyncio.create_task(speculative_chat_completion(user_id, message.content + "\n", user_roles_str))
+                    op_type = await asyncio.to_thread(reminder_handler.detect_reminder_operation_llm, text, user_id)
+                if op_type in ('create', 'list', 'cancel', 'location', 'time') and speculative_task is not None:
+                    speculative_task.cancel()
+                    print(f"🔀 Discarded speculative reply for {op_type} request")
                 if op_type == 'create':
-                    reminder_handler.process_reminder_request(text, user_id)
+                    await reminder_handler.process_reminder_request(text, user_id)
                     return
                 elif op_type == 'list':
-                    reminders_list = reminder_handler.process_list_request(user_id)
-                    await send_with_privacy(reminders_list)
+                    reminders_list, reminders_view = await reminder_handler.process_list_request(user_id)
+                    await send_with_privacy(reminders_list, view=reminders_view)
                     return
                 elif op_type == 'cancel':
-                    cancel_result = reminder_handler.process_cancel_request(text, user_id)
+                    cancel_result = await reminder_handler.process_cancel_request(text, user_id)
                     await send_with_privacy(cancel_result)
                     return
                 elif op_type == 'location':
-                    reminder_handler.process_location_update(text, user_id)
+                    await reminder_handler.process_location_update(text, user_id)
                     return
                 elif op_type == 'time':
                     # Get response for time query
-                    response, _ = reminder_time_handler.process_time_query(text, user_id)
+                    response, _ = await reminder_time_handler.process_time_query(text, user_id)
                     
                     # Only send a response if there is one (empty responses are used for location requests)
                     if response:
@@ -823,9 +1084,9 @@ async def handle_user_message(message):
                                     if isinstance(message.channel, discord.DMChannel):
                                         # Skip username/lookup as we already did it
                                         # Go directly to the location check
-                                        if user_id in AWAITING_LOCATION and AWAITING_LOCATION[user_id] is not None:
+                                        if await AWAITING_LOCATION.get(user_id) is not None:
                                             print(f"🌎 Processing transcribed location: {transcribed_text}")
-                                            reminder_handler.process_location_response(transcribed_text, user_id)
+                                            await reminder_handler.process_location_response(transcribed_text, user_id)
                                             return
                                             
                                         # Rest of the reminder processing
@@ -837,26 +1098,26 @@ async def handle_user_message(message):
                                                 return
                                             from reminders.db import get_user_timezone
                                             if re.search(r"what('?s| is|\s+is)?\s+(my|the)?\s*time[\s-]?zone( am i in| do i have| is it)?\b", text, re.IGNORECASE):
-                                                tz = get_user_timezone(user_id) or 'Not set'
+                                                tz = await get_user_timezone(user_id) or 'Not set'
                                                 await send_with_privacy(f'🌎 **Timezone:** {tz}')
                                                 return
-                                            op_type = reminder_handler.detect_reminder_operation(text, user_id)
+                                            op_type = await asyncio.to_thread(reminder_handler.detect_reminder_operation, text, user_id)
                                             if op_type == 'create':
-                                                reminder_handler.process_reminder_request(text, user_id)
+                                                await reminder_handler.process_reminder_request(text, user_id)
                                                 return
                                             elif op_type == 'list':
-                                                reminders_list = reminder_handler.process_list_request(user_id)
-                                                await send_with_privacy(reminders_list)
+                                                reminders_list, reminders_view = await reminder_handler.process_list_request(user_id)
+                                                await send_with_privacy(reminders_list, view=reminders_view)
                                                 return
                                             elif op_type == 'cancel':
-                                                cancel_result = reminder_handler.process_cancel_request(text, user_id)
+                                                cancel_result = await reminder_handler.process_cancel_request(text, user_id)
                                                 await send_with_privacy(cancel_result)
                                                 return
                                             elif op_type == 'location':
-                                                reminder_handler.process_location_update(text, user_id)
+                                                await reminder_handler.process_location_update(text, user_id)
                                                 return
                                             elif op_type == 'time':
-                                                response, _ = reminder_time_handler.process_time_query(text, user_id)
+                                                response, _ = await reminder_time_handler.process_time_query(text, user_id)
                                                 if response:
                                                     await send_with_privacy(response)
                                                 return
@@ -878,16 +1139,8 @@ async def handle_user_message(message):
                                         except Exception as e:
                                             print(f"Warning: Could not add message to LlamaIndex memory: {e}")
                                         # Determine if this is the user's first-ever message
-                                        is_first_message = len(message_history_cache.get(user_id, [])) == 1  # already appended this one
-                                        messages = []
-                                        if is_first_message:
-                                            messages.append({"role": "system", "content": GREETING_SYSTEM_PROMPT})
-                                            messages.append(user_message)
-                                        else:
-                                            messages.append({"role": "system", "content": SYSTEM_INSTRUCTIONS + user_roles_str})
-                                            if ENABLE_SUMMARIES and conversation_summaries[user_id]:
-                                                messages.append({"role": "system", "content": f"Previous conversation summary: {conversation_summaries[user_id]}"})
-                                            messages.extend(message_history_cache[user_id].copy())
+                                        is_first_message = len(get_history(user_id)) == 1  # already appended this one
+                                        messages = build_chat_messages(user_id, get_history(user_id), user_message, user_roles_str, is_first_message)
                                         
                                         # Rest of normal message processing
                                         response = None
@@ -968,7 +1221,7 @@ async def handle_user_message(message):
                 # IMAGE FLOW: If we have at least one image, use the new image analysis pipeline
                 if image_files:
                     # Detect first message before altering history
-                    is_first_message = len(message_history_cache.get(user_id, [])) == 0
+                    is_first_message = len(get_history(user_id)) == 0
                     # Build multimodal content (text + all images)
                     multimodal_content = []
                     if all_content.strip():
@@ -979,7 +1232,8 @@ async def handle_user_message(message):
                     messages = []
                     messages.append({"role": "system", "content": IMAGE_ANALYSIS_SYSTEM_PROMPT})
                     # Add previous chat history (excluding system prompts and fake image URLs)
-                    for msg in message_history_cache[user_id]:
+                    prior = []
+                    for msg in get_history(user_id):
                         if msg.get("role") == "system":
                             continue
                         content = msg.get("content")
@@ -1006,11 +1260,11 @@ async def handle_user_message(message):
                                         text = item.get("image_url", {}).get("url")
                                         break
                             if text:
-                                messages.append({"role": msg.get("role", "user"), "content": text})
+                                prior.append({"role": msg.get("role", "user"), "content": text})
                         else:
-                            messages.append(msg)
-                    # Add the new user message (with image and/or prompt)
-                    messages.append(user_message)
+                            prior.append(msg)
+                    # Add as much history as the token budget allows, then the new user message (with image and/or prompt)
+                    messages.extend(pack_history(prior + [user_message], CONTEXT_TOKEN_BUDGET - count_prompt_tokens(messages)))
                     # Call the LLM
                     import re
                     response = await asyncio.to_thread(
@@ -1104,32 +1358,34 @@ async def handle_user_message(message):
                     return
                 # TEXT/DOC FLOW: If we get here, it's a text/file message (no images)
                 # Determine if this is the user's first-ever message (no prior history loaded)
-                is_first_message = len(message_history_cache.get(user_id, [])) == 0
+                is_first_message = len(get_history(user_id)) == 0
                 user_message = {"role": "user", "content": all_content}
                 await manage_conversation_history(user_id, user_message)
                 try:
                     memory.put(user_message)
                 except Exception as e:
                     print(f"Warning: Could not add message to LlamaIndex memory: {e}")
-                messages = []
-                if is_first_message:
-                    # Use dedicated greeting prompt instead of normal system instructions
-                    messages.append({"role": "system", "content": GREETING_SYSTEM_PROMPT})
-                    messages.append(user_message)
-                else:
-                    messages.append({"role": "system", "content": SYSTEM_INSTRUCTIONS + user_roles_str})
-                    if ENABLE_SUMMARIES and conversation_summaries[user_id]:
-                        messages.append({"role": "system", "content": f"Previous conversation summary: {conversation_summaries[user_id]}"})
-                    messages.extend(message_history_cache[user_id].copy())
                 response = None
+                speculative_used = False
+                if speculative_task is not None:
+                    # Reply was already requested alongside intent detection
+                    try:
+                        speculative_content, speculative_response = await speculative_task
+                        if speculative_content == all_content:
+                            response = speculative_response
+                            speculative_used = True
+                    except Exception as e:
+                        print(f"⚠️ Speculative reply failed, retrying: {e}")
                 async with message.channel.typing():
                     try:
-                        response = await asyncio.to_thread(
-                            client.chat.completions.create,
-                            model=MODEL,
-                            messages=messages,
-                            temperature=0.7
-                        )
+                        if response is None:
+                            messages = build_chat_messages(user_id, get_history(user_id).copy(), user_message, user_roles_str, is_first_message)
+                            response = await asyncio.to_thread(
+                                client.chat.completions.create,
+                                model=MODEL,
+                                messages=messages,
+                                temperature=0.7
+                            )
                     except Exception as e:
                         await send_with_privacy("⚠️ There was an error getting a response. Please try again later.")
                         return
@@ -1142,7 +1398,9 @@ async def handle_user_message(message):
                     except Exception as e:
                         print(f"Warning: Could not add assistant message to LlamaIndex memory: {e}")
                     await save_memory(user_id, memory)
-                    await log_token_usage(user_id, MODEL, response.usage.prompt_tokens, response.usage.completion_tokens, response.usage.total_tokens)
+                    if not speculative_used:
+                        # A speculative reply's usage was already logged when its request finished
+                        await log_token_usage(user_id, MODEL, response.usage.prompt_tokens, response.usage.completion_tokens, response.usage.total_tokens)
                 else:
                     assistant_reply = "⚠️ No response from the assistant."
                 await send_long_with_privacy(message.channel, assistant_reply)
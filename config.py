@@ -18,11 +18,51 @@ ALLOWED_ROLES = {"Admin"}  # Admin is always allowed
 # Model and memory settings
 MODEL = "gpt-4o-mini"  # Default model
 MAX_TOKEN_LIMIT = 4000     # Maximum tokens to store in memory
-MAX_MESSAGES = 20          # Strict maximum messages to keep per user - never exceeded
+MAX_MESSAGES = 20          # Messages kept per user; older ones are folded into the summary in the background
+CONTEXT_TOKEN_BUDGET = 6000  # Estimated prompt tokens (system prompt, summary and history) per chat request; oldest history is left out first
+CONTEXT_MESSAGE_TOKEN_LIMIT = 1500  # Largest share of the prompt one earlier message may take; longer ones (e.g. pasted documents) are truncated. The message being answered is always sent whole
 ENABLE_SUMMARIES = True    # Set to True to enable conversation summarization
 SUMMARY_PROMPT = "Summarize the previous conversation in less than 150 words, focusing on key points the AI should remember:"
 MAX_HISTORY_DAYS = 14       # Number of days to keep conversation history
 BATCH_SIZE = 5  # Number of messages to summarize at once when over the cap
+SUMMARY_WORKERS = 2  # Background tasks summarizing histories that crossed MAX_MESSAGES
+SUMMARY_BACKLOG_MESSAGES = 10  # Extra messages kept past MAX_MESSAGES while a summary is pending; beyond this the oldest are dropped
+SESSION_CACHE_MAX_USERS = 2000  # Users whose conversation state is kept in memory; least recently active are evicted first
+SESSION_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Estimated bytes of cached history/summaries across all users
+SESSION_IDLE_SECONDS = 24 * 3600  # Sessions unused this long are evicted by the hourly cleanup
+MEMORY_FLUSH_INTERVAL = 10  # Seconds between write-behind flushes of changed conversation memory to conversation_messages
+
+# Reminder scheduler settings
+REMINDER_SWEEP_INTERVAL = 60  # Seconds between safety sweeps for due reminders the timer heap hasn't seen
+REMINDER_DUE_BATCH_LIMIT = 500  # Maximum due reminders fetched per sweep query
+REMINDER_DELIVERY_CONCURRENCY = 10  # Reminders generated/sent in parallel during a burst
+NOTIFICATION_BATCH_SIZE = 20  # Co-due reminders whose notifications are written in one LLM call (1 disables batching)
+NOTIFICATION_LOOKAHEAD_MINUTES = 10  # Pre-write notification text for reminders due within this many minutes (0 disables)
+NOTIFICATION_LOOKAHEAD_INTERVAL = 30  # Seconds between look-ahead passes
+NOTIFICATION_MODE = "llm"  # "llm", "template" (local phrase bank, no API calls) or "auto" (templates while the LLM queue is backed up)
+NOTIFICATION_MODE_BY_GUILD = {}  # Guild ID (string) -> notification mode, overriding NOTIFICATION_MODE for that guild's members
+NOTIFICATION_TEMPLATE_QUEUE_THRESHOLD = 40  # In "auto" mode, reminders waiting on the LLM before new ones use templates
+REMINDER_LEASE_SECONDS = 300  # How long a scheduler process owns a claimed reminder before others may retry it
+CATCHUP_THRESHOLD = 120  # Seconds overdue before the scheduler treats a full claim as a post-downtime backlog
+CATCHUP_RATE = 5  # Reminders per second claimed while catching up on a backlog (0 = unlimited)
+CATCHUP_DIGEST_AFTER = 1800  # Seconds overdue after which a user's late reminders are bundled into one digest DM
+CATCHUP_DIGEST_MAX_REMINDERS = 20  # Most reminders listed in one digest DM; a longer backlog is split over several
+USER_SETTINGS_CACHE_TTL = 300  # Seconds a user's timezone stays cached in-process
+USER_SETTINGS_CACHE_MAX_USERS = 5000  # Users whose timezone is kept cached; oldest entries are dropped first
+INTENT_CLASSIFIER_THRESHOLD = 0.85  # Minimum local classifier confidence to skip the LLM reminder-intent call
+SPECULATIVE_CHAT = True  # Start the chat reply alongside LLM intent detection and discard it if the message was a reminder request
+LOCATION_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "location_cache.json")  # Place -> timezone answers from the LLM, kept across restarts
+LOCATION_CACHE_SIZE = 1024  # Recent location lookups kept in memory
+AWAITING_LOCATION_TTL = 20  # Seconds to wait for a location reply before moving on
+AWAITING_LOCATION_MAX_USERS = 10000  # Most pending location requests held in memory at once
+AWAITING_LOCATION_BACKEND = "memory"  # "memory" (this process only) or "db" (pending_locations table, shared across processes)
+CANCEL_CANDIDATE_LIMIT = 10  # Most reminders shown to the LLM when it has to pick which ones to cancel
+REMINDER_ARCHIVE_RETENTION_DAYS = 30  # Days sent/cancelled reminders stay in the reminders table before archiving
+REMINDER_ARCHIVE_BATCH_SIZE = 1000  # Rows moved to reminders_archive per transaction
+REMINDER_ARCHIVE_INTERVAL = 3600  # Seconds between archival runs
+REMINDER_LIST_PAGE_SIZE = 10  # Reminders per page when listing (next/prev buttons page through the rest)
+REMINDER_LIST_CACHE_TTL = 60  # Seconds a formatted reminder list page is reused; relative times go stale after that
+REMINDER_LIST_CACHE_MAX_USERS = 1000  # Users whose formatted reminder lists are kept in memory
  
 # -----------------------------------------------------------------------------
 # GREETING PROMPT (First Message Only)
@@ -785,6 +825,32 @@ def get_reminder_notification_prompt():
     Include 1-2 relevant emojis based on the reminder content.
     Keep it brief and friendly (1-2 sentences maximum)."""
 
+def get_reminder_notification_batch_prompt():
+    return """Create an engaging reminder notification message for each reminder in a list.
+
+    Input format:
+    {
+      "reminders": [
+        {"id": 123, "content": "what to remember"}
+      ]
+    }
+
+    Return ONLY a JSON object with exactly one notification per input reminder, using the same ids:
+    {
+      "notifications": [
+        {"id": 123, "message": "the notification"}
+      ]
+    }
+
+    Each message follows these rules:
+    CRITICAL: The reminder content MUST start with a capital letter, but the rest of the content should be lowercase.
+    Create a friendly, attention-grabbing message to notify someone about their reminder.
+    Start with "⏰ Reminder:" followed by the content.
+    Add a motivational or relevant follow-up sentence if appropriate.
+    Include 1-2 relevant emojis based on the reminder content.
+    Keep it brief and friendly (1-2 sentences maximum).
+    Write each message independently; never mention the other reminders."""
+
 # -----------------------------------------------------------------------------
 # REMINDER OPERATION DETECTION PROMPT
 # -----------------------------------------------------------------------------
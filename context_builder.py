@@ -0,0 +1,77 @@
+import math
+import re
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MESSAGE_TOKEN_LIMIT
+
+# Local token estimates for prompt assembly. Roughly 4 characters per token
+# for English text; close enough to budget a prompt without a tokenizer.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4   # Role and framing tokens per chat message
+IMAGE_TOKENS = 765            # A high-detail image tile set, as billed by the API
+_DOCUMENT_SECTION = re.compile(r"\[Content from ([^\]]+)\]:\n.*?(?=\n\[Content from |\Z)", re.S)
+
+def estimate_text_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def estimate_message_tokens(msg):
+    """Estimated prompt tokens for one chat message (text or multimodal)"""
+    content = msg.get("content")
+    if isinstance(content, list):
+        tokens = 0
+        for item in content:
+            if not isinstance(item, dict):
+                continue
+            if item.get("type") == "image_url":
+                tokens += IMAGE_TOKENS
+            else:
+                tokens += estimate_text_tokens(item.get("text") or "")
+    else:
+        tokens = estimate_text_tokens(content or "")
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+def _truncate(text, max_tokens):
+    max_chars = max(0, max_tokens - MESSAGE_OVERHEAD_TOKENS) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"\n[...truncated {len(text) - max_chars} characters]"
+
+def shrink_message(msg, max_tokens, keep_documents=True):
+    """Copy of msg cut down to about max_tokens.
+
+    Older turns (keep_documents=False) lose the body of any attached document
+    first, keeping just the note that it was shared; whatever is still too
+    long is truncated.
+    """
+    content = msg.get("content")
+    if not isinstance(content, str) or estimate_message_tokens(msg) <= max_tokens:
+        return msg
+    if not keep_documents:
+        content = _DOCUMENT_SECTION.sub(lambda m: f"[Content from {m.group(1)}]: (document text omitted from context)", content)
+    return {**msg, "content": _truncate(content, max_tokens)}
+
+def pack_history(history, budget=CONTEXT_TOKEN_BUDGET, message_limit=CONTEXT_MESSAGE_TOKEN_LIMIT):
+    """The newest messages of history that fit in budget tokens, oldest first.
+
+    The latest message is the one being answered: it is always included and
+    kept whole (a freshly uploaded document has to reach the model), so older
+    history only gets what is left of the budget. Older messages are capped
+    at message_limit and added newest first until the next one would not fit,
+    so the result is always an unbroken tail of the conversation.
+    """
+    if not history:
+        return []
+    latest = history[-1]
+    used = estimate_message_tokens(latest)
+    packed = [latest]
+    for msg in reversed(history[:-1]):
+        msg = shrink_message(msg, message_limit, keep_documents=False)
+        tokens = estimate_message_tokens(msg)
+        if used + tokens > budget:
+            break
+        packed.append(msg)
+        used += tokens
+    packed.reverse()
+    return packed
+
+def count_prompt_tokens(messages):
+    return sum(estimate_message_tokens(msg) for msg in messages)
@@ -0,0 +1,104 @@
+import difflib
+import re
+
+# Local front end for process_cancel_request. Requests that name a reminder
+# exactly (its content, or its time) or use a fixed phrase ("cancel that",
+# "cancel all my reminders") are resolved here. For the rest, only the
+# best-matching few reminders are sent to the LLM instead of the whole list.
+
+_CANCEL_VERBS = r"(?:cancel|delete|remove|clear|stop|drop|get rid of)"
+_FILLER = {
+    'please', 'can', 'could', 'you', 'would', 'will', 'cancel', 'delete', 'remove', 'clear', 'stop', 'drop',
+    'get', 'rid', 'of', 'my', 'the', 'a', 'an', 'reminder', 'reminders', 'about', 'to', 'for', 'that', 'i',
+    'set', 'me', 'remind', 'on', 'at', 'is', 'was', 'which', 'it', 'one'
+}
+_RECENT = re.compile(
+    rf"^(?:please\s+)?{_CANCEL_VERBS}\s+(?:that|this|it|the last(?: one| reminder)?|my last(?: one| reminder)?"
+    r"|the (?:most )?recent(?: one| reminder)?|my (?:most )?recent(?: one| reminder)?|that reminder|this reminder"
+    r"|the reminder i just (?:set|made|created))\s*[.!]?$"
+)
+_ALL = re.compile(rf"^(?:please\s+)?{_CANCEL_VERBS}\s+(?:all|every|each)(?: of)? (?:my |the )?reminders?\s*[.!]?$")
+_TIMEPERIOD = re.compile(
+    rf"^(?:please\s+)?{_CANCEL_VERBS}\s+(?:all\s+(?:of\s+)?)?(?:my\s+|the\s+)?"
+    r"(?:(?P<before>today|tomorrow)'?s\s+reminders?|reminders?\s+(?:for|on)\s+(?P<after>today|tomorrow))\s*[.!]?$"
+)
+_CLOCK = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m\.?\b")
+
+def _normalize(text):
+    text = text.lower()
+    # "3pm" -> "3:00 pm" so it lines up with the "(today at 3:00 PM)" suffix
+    text = _CLOCK.sub(lambda m: f"{int(m.group(1))}:{m.group(2) or '00'} {m.group(3)}m", text)
+    return re.sub(r"[^\w:\s]", " ", text)
+
+def _tokens(text):
+    return [token for token in _normalize(text).split() if token not in _FILLER]
+
+def _query_clock(text):
+    match = _CLOCK.search(text.lower())
+    if not match:
+        return None
+    return f"{int(match.group(1))}:{match.group(2) or '00'} {match.group(3).upper()}M"
+
+def resolve_cancellation_locally(text, enhanced_reminders):
+    """Return cancel_data (same shape as the LLM's JSON) for unambiguous requests, otherwise None"""
+    lowered = re.sub(r"\s+", " ", text.strip().lower())
+    if _RECENT.match(lowered):
+        return {"type": "recent", "content": None, "timeperiod": None, "matches": []}
+    if _ALL.match(lowered):
+        return {"type": "all", "content": None, "timeperiod": "all", "matches": []}
+    match = _TIMEPERIOD.match(lowered)
+    if match:
+        return {"type": "timeperiod", "content": None, "timeperiod": match.group('before') or match.group('after'), "matches": []}
+
+    query = " ".join(_tokens(text))
+    if not query:
+        return None
+    # Exact content match ("cancel my reminder to call mom" vs "call mom")
+    matches = [i for i, r in enumerate(enhanced_reminders) if " ".join(_tokens(r['content'])) == query]
+    if matches:
+        return {"type": "content", "content": query, "timeperiod": None, "matches": matches}
+    # Time-only request ("cancel my 3pm reminder") matching exactly one reminder time
+    clock = _query_clock(text)
+    if clock and all(token in _normalize(clock).split() for token in query.split()):
+        matches = [i for i, r in enumerate(enhanced_reminders) if r['enhanced_content'].endswith(f" at {clock})")]
+        if len(matches) == 1:
+            return {"type": "content", "content": query, "timeperiod": None, "matches": matches}
+    return None
+
+def _score(query_tokens, query_text, reminder):
+    reminder_tokens = _tokens(reminder['enhanced_content'])
+    if not reminder_tokens:
+        return 0.0
+    overlap = 0.0
+    for token in query_tokens:
+        if token in reminder_tokens:
+            overlap += 1.0
+        elif len(token) >= 3 and any(other.startswith(token[:3]) or token.startswith(other[:3]) for other in reminder_tokens if len(other) >= 3):
+            # "eating" vs "eat", "calling" vs "call"
+            overlap += 0.5
+    similarity = difflib.SequenceMatcher(None, query_text, " ".join(_tokens(reminder['content']))).ratio()
+    return overlap / len(query_tokens) + 0.5 * similarity
+
+def search_terms(text):
+    """The words of a cancel request worth searching reminder content for"""
+    return " ".join(token for token in _tokens(text) if not re.fullmatch(r"[\d:]+|[ap]m", token))
+
+def rank_cancellation_candidates(text, enhanced_reminders, limit):
+    """Indices of the reminders most likely meant by a cancel request, best first.
+
+    The LLM only sees these candidates; its answer indexes into this list and
+    is mapped back to enhanced_reminders by the caller.
+    """
+    if len(enhanced_reminders) <= limit:
+        return list(range(len(enhanced_reminders)))
+    query_tokens = _tokens(text)
+    if query_tokens:
+        query_text = " ".join(query_tokens)
+        ranked = sorted(
+            range(len(enhanced_reminders)),
+            key=lambda i: (-_score(query_tokens, query_text, enhanced_reminders[i]), i)
+        )
+    else:
+        # Nothing to rank on; the soonest reminders are the most likely targets
+        ranked = list(range(len(enhanced_reminders)))
+    return ranked[:limit]
@@ -0,0 +1,101 @@
+import logging
+import time
+from datetime import datetime
+import pytz
+
+from config import CATCHUP_THRESHOLD, CATCHUP_RATE, CATCHUP_DIGEST_AFTER
+from .timer_heap import _as_utc
+
+def lateness_seconds(reminder, now=None):
+    """How long after its due time a reminder is being handled"""
+    now = now or datetime.now(pytz.UTC)
+    return (now - _as_utc(reminder['scheduled_time'])).total_seconds()
+
+def format_lateness(seconds):
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} minute{'s' if minutes != 1 else ''}"
+    hours = minutes // 60
+    if hours < 48:
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    days = hours // 24
+    return f"{days} day{'s' if days != 1 else ''}"
+
+def render_digest(reminders):
+    """One DM covering several reminders that came due while the bot was down"""
+    now = datetime.now(pytz.UTC)
+    lines = [f"⏰ **While I was away, {len(reminders)} of your reminders came due:**"]
+    for reminder in sorted(reminders, key=lambda r: _as_utc(r['scheduled_time'])):
+        content = ' '.join(word.capitalize() for word in reminder['content'].split())
+        lines.append(f"• {content} (due {format_lateness(lateness_seconds(reminder, now))} ago)")
+    lines.append("\nSorry for the delay! 🙏")
+    return "\n".join(lines)
+
+class CatchUpPolicy:
+    """How the scheduler drains overdue reminders after downtime.
+
+    Once a claim turns up reminders more than `threshold` seconds late, the
+    scheduler is catching up: claims are rate-limited to `rate` reminders per
+    second and taken freshest first, so reminders that are only just due aren't
+    stuck behind hours of backlog. Catch-up ends when a claim comes back short.
+    A user's reminders more than `digest_after` seconds late are sent as one
+    digest; the scheduler claims the rest of that user's very late backlog
+    into it rather than spreading it over many rate-limited claims.
+    """
+
+    def __init__(self, threshold=CATCHUP_THRESHOLD, rate=CATCHUP_RATE, digest_after=CATCHUP_DIGEST_AFTER):
+        self.threshold = threshold
+        self.rate = rate
+        self.digest_after = digest_after
+        self.active = False
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+
+    def claim_limit(self, limit):
+        """How many reminders to claim now, given the normal limit"""
+        if not self.active or not self.rate:
+            return limit
+        now = time.monotonic()
+        # Allow at most one second's worth of burst
+        self._tokens = min(float(self.rate), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        return min(limit, int(self._tokens))
+
+    def observe_due(self, due):
+        """Start catching up before claiming if reminders popped from the timer heap are already very late"""
+        if self.active or not due or max(lateness_seconds(reminder) for reminder in due) <= self.threshold:
+            return
+        self.active = True
+        # A full second's worth, so the first backlog claim isn't held back
+        self._tokens = float(self.rate)
+        self._last_refill = time.monotonic()
+        logging.info(f"🔔 Overdue reminder backlog found; catching up freshest first at {self.rate}/s")
+
+    def record_claim(self, claimed, full):
+        """Update catch-up state after a claim; full means more reminders are probably waiting"""
+        if self.active:
+            self._tokens = max(0.0, self._tokens - len(claimed))
+            if not full:
+                self.active = False
+                logging.info("🔔 Caught up on overdue reminders")
+        elif full and claimed and max(lateness_seconds(reminder) for reminder in claimed) > self.threshold:
+            self.active = True
+            self._tokens = 0.0
+            self._last_refill = time.monotonic()
+            logging.info(f"🔔 Overdue reminder backlog found; catching up freshest first at {self.rate}/s")
+
+    def split_very_late(self, claimed):
+        """Separate reminders to send individually from very late ones that go into per-user digests.
+
+        Returns:
+            tuple: (singles, very_late) where very_late maps user_id -> reminders
+        """
+        very_late = {}
+        singles = []
+        now = datetime.now(pytz.UTC)
+        for reminder in claimed:
+            if lateness_seconds(reminder, now) > self.digest_after:
+                very_late.setdefault(reminder['user_id'], []).append(reminder)
+            else:
+                singles.append(reminder)
+        return singles, very_late
@@ -1,36 +1,32 @@
+import asyncio
+import json
 import logging
-import pymysql
+import time
+from collections import OrderedDict
 from datetime import datetime
 import pytz
-from config import (
-    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
-)
-
-def get_db_connection():
-    """Get a connection to the MySQL database"""
-    import os
-    logging.info("[PyMySQL] Attempting to connect to database.")
-    return pymysql.connect(
-        host=os.environ.get('DB_HOST', DB_HOST),
-        user=os.environ.get('DB_USER', DB_USER),
-        password=os.environ.get('DB_PASSWORD', DB_PASSWORD),
-        database=os.environ.get('DB_NAME', DB_NAME),
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
-    )
-
-def save_reminder(user_id, content, scheduled_time, timezone=None, status='pending'):
+import aiomysql
+import reminders.db_pool
+from config import REMINDER_DUE_BATCH_LIMIT, REMINDER_LEASE_SECONDS, USER_SETTINGS_CACHE_TTL, USER_SETTINGS_CACHE_MAX_USERS
+from config import REMINDER_ARCHIVE_RETENTION_DAYS, REMINDER_ARCHIVE_BATCH_SIZE, REMINDER_LIST_PAGE_SIZE
+from .timer_heap import reminder_heap
+from .list_cache import reminder_list_cache
+
+# All reminder queries run on the shared aiomysql pool (reminders.db_pool.db_pool),
+# so nothing here blocks the Discord gateway loop or opens a fresh connection per call.
+
+async def save_reminder(user_id, content, scheduled_time, timezone=None, status='pending'):
     """Save a reminder to the database"""
     try:
         # Ensure scheduled_time has timezone info
         if not scheduled_time.tzinfo:
             logging.error("❌ Scheduled time must have timezone information")
             return False
-            
+
         # Convert to UTC for storage
         formatted_utc = scheduled_time.astimezone(pytz.UTC)
         logging.info(f"⏰ Saving reminder with UTC time: {formatted_utc}")
-        
+
         # For relative times (like "in 30 minutes"), we don't want to set original_timezone
         # For absolute times, we want to preserve the timezone the reminder was set in
         original_timezone = None
@@ -40,230 +36,530 @@ def save_reminder(user_id, content, scheduled_time, timezone=None, status='pendi
             # Try to get the timezone from the scheduled_time
             if scheduled_time.tzinfo and str(scheduled_time.tzinfo) != 'UTC':
                 original_timezone = str(scheduled_time.tzinfo)
-        
+
         # If we still don't have an original_timezone, default to UTC
         if not original_timezone:
             original_timezone = 'UTC'
-            
+
         logging.info(f"⏰ Saving reminder with timezone: {timezone}, original_timezone: {original_timezone}")
-        
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Insert the reminder with both timezone and original_timezone
-            # Explicitly use UTC_TIMESTAMP() for created_at
-            cursor.execute("""
-                INSERT INTO reminders 
-                (user_id, content, scheduled_time, timezone, original_timezone, status, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, UTC_TIMESTAMP())
-            """, (user_id, content, formatted_utc, timezone or 'UTC', original_timezone, status))
-            reminder_id = cursor.lastrowid
-            conn.commit()
-            cursor.execute("""
-                SELECT scheduled_time, timezone, original_timezone 
-                FROM reminders 
-                WHERE id = %s
-            """, (reminder_id,))
-            saved_reminder = cursor.fetchone()
-            if saved_reminder:
-                saved_time, saved_tz, saved_orig_tz = saved_reminder
-                logging.info(f"✅ Saved reminder with time: {saved_time}, timezone: {saved_tz}, original_timezone: {saved_orig_tz}")
-            return reminder_id
-                
+
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                # Insert the reminder with both timezone and original_timezone
+                # Explicitly use UTC_TIMESTAMP() for created_at
+                await cursor.execute("""
+                    INSERT INTO reminders
+                    (user_id, content, scheduled_time, timezone, original_timezone, status, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, UTC_TIMESTAMP())
+                """, (user_id, content, formatted_utc, timezone or 'UTC', original_timezone, status))
+                reminder_id = cursor.lastrowid
+                await conn.commit()
+        logging.info(f"✅ Saved reminder {reminder_id} with time: {formatted_utc}, timezone: {timezone or 'UTC'}, original_timezone: {original_timezone}")
+        reminder_list_cache.invalidate(user_id)
+        # Hand pending reminders straight to the scheduler's timer heap
+        if status == 'pending':
+            reminder_heap.push({
+                'id': reminder_id,
+                'user_id': user_id,
+                'content': content,
+                'scheduled_time': formatted_utc
+            })
+        return reminder_id
+
     except Exception as e:
         logging.error(f"❌ Error saving reminder: {e}")
         return False
 
-def get_user_timezone(user_id):
-    """Get the user's timezone from their most recent reminder"""
+# Read-through cache of user_settings.timezone: user_id -> (timezone, expires_at)
+# The TTL bounds staleness when another bot process changes a user's timezone
+_timezone_cache = OrderedDict()
+
+def _cache_user_timezone(user_id, timezone):
+    now = time.monotonic()
+    _timezone_cache.pop(user_id, None)
+    _timezone_cache[user_id] = (timezone, now + USER_SETTINGS_CACHE_TTL)
+    # Every entry has the same TTL, so the oldest inserted are the first to expire
+    while _timezone_cache and (len(_timezone_cache) > USER_SETTINGS_CACHE_MAX_USERS or next(iter(_timezone_cache.values()))[1] <= now):
+        _timezone_cache.popitem(last=False)
+
+def invalidate_user_timezone(user_id):
+    """Drop a user's cached timezone so the next read goes to user_settings"""
+    _timezone_cache.pop(user_id, None)
+
+async def get_user_timezone(user_id):
+    """Get the user's timezone from user_settings (cached)"""
+    cached = _timezone_cache.get(user_id)
+    if cached:
+        if cached[1] > time.monotonic():
+            return cached[0]
+        del _timezone_cache[user_id]
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-                query = """
-                SELECT timezone 
-                FROM reminders 
-                WHERE user_id = %s 
-                AND timezone IS NOT NULL 
-                AND timezone != 'UTC'
-                ORDER BY created_at DESC 
-                LIMIT 1
-                """
-                
-                cursor.execute(query, (user_id,))
-                result = cursor.fetchone()
-                
-                if result and result['timezone']:
-                    logging.info(f"✅ Found user timezone: {result['timezone']}")
-                    return result['timezone']
-                
-                return None
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT timezone FROM user_settings WHERE user_id = %s", (user_id,))
+                result = await cursor.fetchone()
+                timezone = result['timezone'] if result and result['timezone'] else None
+                # Cache misses too, so users without a timezone don't hit the DB every message
+                _cache_user_timezone(user_id, timezone)
+                if timezone:
+                    logging.info(f"✅ Found user timezone: {timezone}")
+                return timezone
     except Exception as e:
         logging.error(f"❌ Error getting user timezone: {e}")
         return None
 
-def update_user_timezone(user_id, new_timezone):
-    """Update the timezone for all pending reminders and most recent cancelled reminder for this user"""
+async def update_user_timezone(user_id, new_timezone):
+    """Store the user's timezone in user_settings (one row per user)"""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                # First update all pending reminders EXCEPT relative time reminders (with timezone='UTC')
-                pending_query = """
-                UPDATE reminders 
-                SET timezone = %s 
-                WHERE user_id = %s AND status = 'pending' AND timezone != 'UTC'
-                """
-                cursor.execute(pending_query, (new_timezone, user_id))
-                pending_affected = cursor.rowcount
-                
-                # Then update the most recent cancelled reminder (used for timezone storage)
-                cancelled_query = """
-                UPDATE reminders 
-                SET timezone = %s 
-                WHERE user_id = %s 
-                AND status = 'cancelled'
-                AND id = (
-                    SELECT id FROM (
-                        SELECT id 
-                        FROM reminders 
-                        WHERE user_id = %s 
-                        AND status = 'cancelled'
-                        ORDER BY created_at DESC 
-                        LIMIT 1
-                    ) as sub
-                )
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                query = """
+                INSERT INTO user_settings (user_id, timezone) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE timezone = VALUES(timezone)
                 """
-                cursor.execute(cancelled_query, (new_timezone, user_id, user_id))
-                cancelled_affected = cursor.rowcount
-                
-                conn.commit()
-                
-                total_affected = pending_affected + cancelled_affected
-                logging.info(f"✅ Updated timezone to {new_timezone} for {pending_affected} pending and {cancelled_affected} cancelled reminders")
-                return total_affected
+                await cursor.execute(query, (user_id, new_timezone))
+                await conn.commit()
+        invalidate_user_timezone(user_id)
+        reminder_list_cache.invalidate(user_id)
+        logging.info(f"✅ Updated timezone to {new_timezone} for {user_id}")
+        return True
     except Exception as e:
         logging.error(f"❌ Error updating user timezone: {e}")
+        return False
+
+async def ensure_reminder_schema():
+    """Create the scheduler's indexes and lease columns on reminders, plus the user_settings, reminders_archive and pending_locations tables"""
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SHOW INDEX FROM reminders WHERE Key_name = 'idx_reminders_status_scheduled'")
+                index_exists = await cursor.fetchone()
+                if not index_exists:
+                    await cursor.execute("CREATE INDEX idx_reminders_status_scheduled ON reminders (status, scheduled_time)")
+                    await conn.commit()
+                    print("✅ Created (status, scheduled_time) index on reminders table")
+                else:
+                    print("✅ Reminders (status, scheduled_time) index already exists")
+                # Content search (get_reminder_by_content) uses MATCH ... AGAINST instead of LIKE '%term%'
+                await cursor.execute("SHOW INDEX FROM reminders WHERE Key_name = 'ft_reminders_content'")
+                fulltext_exists = await cursor.fetchone()
+                if not fulltext_exists:
+                    await cursor.execute("CREATE FULLTEXT INDEX ft_reminders_content ON reminders (content)")
+                    await conn.commit()
+                    print("✅ Created FULLTEXT index on reminders content")
+                else:
+                    print("✅ Reminders content FULLTEXT index already exists")
+                # Keyset pagination of a user's list (get_user_reminders_page) walks this index
+                await cursor.execute("SHOW INDEX FROM reminders WHERE Key_name = 'idx_reminders_user_status_scheduled'")
+                user_index_exists = await cursor.fetchone()
+                if not user_index_exists:
+                    await cursor.execute("CREATE INDEX idx_reminders_user_status_scheduled ON reminders (user_id, status, scheduled_time, id)")
+                    await conn.commit()
+                    print("✅ Created (user_id, status, scheduled_time) index on reminders table")
+                else:
+                    print("✅ Reminders (user_id, status, scheduled_time) index already exists")
+                # Lease columns let several scheduler processes split due reminders
+                await cursor.execute("SHOW COLUMNS FROM reminders LIKE 'lease_owner'")
+                lease_exists = await cursor.fetchone()
+                if not lease_exists:
+                    await cursor.execute("""
+                    ALTER TABLE reminders
+                    ADD COLUMN lease_owner VARCHAR(64) DEFAULT NULL,
+                    ADD COLUMN lease_expires_at DATETIME DEFAULT NULL
+                    """)
+                    await conn.commit()
+                    print("✅ Added lease_owner/lease_expires_at columns to reminders table")
+                else:
+                    print("✅ Reminder lease columns already exist")
+                # Notification text written ahead of the due time by the scheduler's look-ahead pass
+                await cursor.execute("SHOW COLUMNS FROM reminders LIKE 'notification_text'")
+                notification_exists = await cursor.fetchone()
+                if not notification_exists:
+                    await cursor.execute("ALTER TABLE reminders ADD COLUMN notification_text TEXT DEFAULT NULL")
+                    await conn.commit()
+                    print("✅ Added notification_text column to reminders table")
+                else:
+                    print("✅ Reminder notification_text column already exists")
+                # When each reminder actually went out, and how late (also kept on archived rows)
+                for table in ('reminders', 'reminders_archive'):
+                    await cursor.execute(f"SHOW TABLES LIKE '{table}'")
+                    if not await cursor.fetchone():
+                        continue
+                    await cursor.execute(f"SHOW COLUMNS FROM {table} LIKE 'delivery_lateness'")
+                    lateness_exists = await cursor.fetchone()
+                    if not lateness_exists:
+                        await cursor.execute(f"""
+                        ALTER TABLE {table}
+                        ADD COLUMN sent_at DATETIME DEFAULT NULL,
+                        ADD COLUMN delivery_lateness INT DEFAULT NULL
+                        """)
+                        await conn.commit()
+                        print(f"✅ Added sent_at/delivery_lateness columns to {table} table")
+                    else:
+                        print(f"✅ {table} delivery lateness columns already exist")
+                # Per-user settings, seeded once from each user's latest reminder timezone
+                await cursor.execute("SHOW TABLES LIKE 'user_settings'")
+                settings_exists = await cursor.fetchone()
+                if not settings_exists:
+                    await cursor.execute("""
+                    CREATE TABLE user_settings (
+                        user_id VARCHAR(255) PRIMARY KEY,
+                        timezone VARCHAR(64) DEFAULT NULL,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    )
+                    """)
+                    await cursor.execute("""
+                    INSERT IGNORE INTO user_settings (user_id, timezone)
+                    SELECT r.user_id, r.timezone
+                    FROM reminders r
+                    JOIN (
+                        SELECT user_id, MAX(created_at) AS created_at
+                        FROM reminders
+                        WHERE timezone IS NOT NULL AND timezone != 'UTC'
+                        GROUP BY user_id
+                    ) latest ON r.user_id = latest.user_id AND r.created_at = latest.created_at
+                    WHERE r.timezone IS NOT NULL AND r.timezone != 'UTC'
+                    """)
+                    await conn.commit()
+                    print(f"✅ User settings table created ({cursor.rowcount} timezones migrated from reminders)")
+                else:
+                    print("✅ User settings table already exists")
+                # Sent/cancelled reminders past their retention are moved here by archive_reminders()
+                await cursor.execute("SHOW TABLES LIKE 'reminders_archive'")
+                archive_exists = await cursor.fetchone()
+                if not archive_exists:
+                    await cursor.execute("CREATE TABLE reminders_archive LIKE reminders")
+                    await cursor.execute("ALTER TABLE reminders_archive ADD COLUMN archived_at DATETIME DEFAULT CURRENT_TIMESTAMP")
+                    await conn.commit()
+                    print("✅ Reminders archive table created")
+                else:
+                    print("✅ Reminders archive table already exists")
+                # Reminder data parked while waiting for a location reply (AWAITING_LOCATION_BACKEND = "db")
+                await cursor.execute("SHOW TABLES LIKE 'pending_locations'")
+                pending_exists = await cursor.fetchone()
+                if not pending_exists:
+                    await cursor.execute("""
+                    CREATE TABLE pending_locations (
+                        user_id VARCHAR(255) PRIMARY KEY,
+                        reminder_data TEXT NOT NULL,
+                        expires_at DATETIME NOT NULL,
+                        INDEX idx_pending_locations_expires (expires_at)
+                    )
+                    """)
+                    await conn.commit()
+                    print("✅ Pending locations table created")
+                else:
+                    print("✅ Pending locations table already exists")
+    except Exception as e:
+        print(f"❌ Failed to ensure reminder schema: {e}")
+
+async def save_pending_location(user_id, reminder_data, ttl_seconds):
+    """Park reminder data until the user replies with a location"""
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("""
+                INSERT INTO pending_locations (user_id, reminder_data, expires_at)
+                VALUES (%s, %s, UTC_TIMESTAMP() + INTERVAL %s SECOND)
+                ON DUPLICATE KEY UPDATE reminder_data = VALUES(reminder_data), expires_at = VALUES(expires_at)
+                """, (user_id, json.dumps(reminder_data), int(ttl_seconds)))
+        return True
+    except Exception as e:
+        logging.error(f"❌ Error saving pending location request: {e}")
+        return False
+
+async def get_pending_location(user_id):
+    """Return the parked reminder data for a user, or None if missing or expired"""
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT reminder_data FROM pending_locations WHERE user_id = %s AND expires_at > UTC_TIMESTAMP()",
+                    (user_id,)
+                )
+                row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        logging.error(f"❌ Error getting pending location request: {e}")
+        return None
+
+async def delete_pending_location(user_id):
+    """Drop a user's parked reminder data; returns True if a row was removed"""
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("DELETE FROM pending_locations WHERE user_id = %s", (user_id,))
+                return cursor.rowcount > 0
+    except Exception as e:
+        logging.error(f"❌ Error deleting pending location request: {e}")
+        return False
+
+async def purge_expired_pending_locations():
+    """Delete pending location requests whose TTL has passed"""
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("DELETE FROM pending_locations WHERE expires_at <= UTC_TIMESTAMP() LIMIT 1000")
+                return cursor.rowcount
+    except Exception as e:
+        logging.error(f"❌ Error purging pending location requests: {e}")
         return 0
 
-import reminders.db_pool
-import aiomysql
+async def get_pending_reminders():
+    """Get every pending reminder, used to seed the scheduler's timer heap (async, using aiomysql)"""
+    async with reminders.db_pool.db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            query = """
+            SELECT id, user_id, content, scheduled_time
+            FROM reminders
+            WHERE status = 'pending'
+            ORDER BY scheduled_time ASC
+            """
+            await cursor.execute(query)
+            return await cursor.fetchall()
+
+async def claim_due_reminders(worker_id, limit=REMINDER_DUE_BATCH_LIMIT, lease_seconds=REMINDER_LEASE_SECONDS, freshest_first=False, user_id=None, late_by=0):
+    """Lease due reminders to this worker so other scheduler processes skip them.
+
+    Rows locked by another worker's in-progress claim are skipped rather than
+    waited on, and leases left behind by a crashed worker become claimable
+    again once they expire. freshest_first claims the most recently due
+    reminders first, for draining a backlog after downtime. user_id and
+    late_by narrow the claim to one user's reminders at least late_by seconds
+    overdue, for gathering a catch-up digest.
+    """
+    async with reminders.db_pool.db_pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                query = """
+                SELECT id, user_id, content, scheduled_time, timezone, notification_text
+                FROM reminders
+                WHERE status = 'pending'
+                AND scheduled_time <= UTC_TIMESTAMP() - INTERVAL %s SECOND
+                AND (lease_expires_at IS NULL OR lease_expires_at < UTC_TIMESTAMP())
+                {user_filter}
+                ORDER BY scheduled_time {order}
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """.format(
+                    user_filter='AND user_id = %s' if user_id is not None else '',
+                    order='DESC' if freshest_first else 'ASC'
+                )
+                params = (late_by, user_id, limit) if user_id is not None else (late_by, limit)
+                await cursor.execute(query, params)
+                claimed = await cursor.fetchall()
+                if claimed:
+                    ids = [reminder['id'] for reminder in claimed]
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    await cursor.execute(f"""
+                    UPDATE reminders
+                    SET lease_owner = %s,
+                        lease_expires_at = UTC_TIMESTAMP() + INTERVAL %s SECOND
+                    WHERE id IN ({placeholders})
+                    """, (worker_id, lease_seconds, *ids))
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    if claimed:
+        logging.info(f"🔒 Worker {worker_id} claimed {len(claimed)} due reminders")
+    return claimed
 
-async def get_due_reminders():
-    """Get all reminders that are due to be sent (async, using aiomysql)"""
+async def get_upcoming_reminders_without_notification(within_seconds, limit=REMINDER_DUE_BATCH_LIMIT):
+    """Get pending reminders due within the next within_seconds that have no pre-written notification yet"""
     try:
-        now_utc = datetime.now(pytz.UTC)
         async with reminders.db_pool.db_pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
                 query = """
-                SELECT id, user_id, content, scheduled_time, timezone,
-                       TIMEDIFF(NOW(), scheduled_time) as time_since_due
-                FROM reminders 
-                WHERE status = 'pending' 
+                SELECT id, user_id, content, scheduled_time
+                FROM reminders
+                WHERE status = 'pending'
+                AND scheduled_time > UTC_TIMESTAMP()
+                AND scheduled_time <= UTC_TIMESTAMP() + INTERVAL %s SECOND
+                AND notification_text IS NULL
                 ORDER BY scheduled_time ASC
+                LIMIT %s
                 """
-                await cursor.execute(query)
-                all_reminders = await cursor.fetchall()
-                due_reminders = []
-                for reminder in all_reminders:
-                    try:
-                        reminder_tz = pytz.timezone(reminder['timezone']) if reminder['timezone'] else pytz.UTC
-                        scheduled_utc = reminder['scheduled_time'].replace(tzinfo=pytz.UTC)
-                        if scheduled_utc <= now_utc:
-                            due_reminders.append(reminder)
-                    except Exception as e:
-                        logging.error(f"❌ Error checking reminder {reminder['id']}: {e}")
-                        continue
-                return due_reminders
+                await cursor.execute(query, (within_seconds, limit))
+                return await cursor.fetchall()
     except Exception as e:
-        logging.error(f"❌ Error fetching due reminders: {e}")
+        logging.error(f"❌ Error fetching upcoming reminders: {e}")
         return []
 
-async def mark_reminder_sent(reminder_id):
-    """Mark a reminder as sent with retry mechanism"""
+async def save_reminder_notifications(notifications):
+    """Store pre-written notification text ({reminder_id: text}) on still-pending reminders"""
+    if not notifications:
+        return 0
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                # Never overwrite text another process already wrote
+                await cursor.executemany("""
+                UPDATE reminders
+                SET notification_text = %s
+                WHERE id = %s AND status = 'pending' AND notification_text IS NULL
+                """, [(text, reminder_id) for reminder_id, text in notifications.items()])
+                await conn.commit()
+                return cursor.rowcount
+    except Exception as e:
+        logging.error(f"❌ Error saving pre-written notifications: {e}")
+        return 0
+
+async def release_reminder_lease(reminder_id, worker_id):
+    """Give up this worker's lease so the reminder can be retried right away"""
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                query = """
+                UPDATE reminders
+                SET lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = %s AND lease_owner = %s AND status = 'pending'
+                """
+                await cursor.execute(query, (reminder_id, worker_id))
+                await conn.commit()
+                return cursor.rowcount > 0
+    except Exception as e:
+        logging.error(f"❌ Error releasing lease on reminder {reminder_id}: {e}")
+        return False
+
+async def mark_reminder_sent(reminder_id, user_id=None, delivered=True):
+    """Mark a reminder as sent with retry mechanism
+
+    A reminder whose DM failed is still marked sent (so it isn't retried
+    forever) but gets no sent_at or delivery_lateness.
+    """
     max_retries = 3
     base_delay = 1  # seconds
-    
+
     for attempt in range(max_retries):
         try:
-            with get_db_connection() as conn:
-                with conn.cursor() as cursor:
-                    query = "UPDATE reminders SET status = 'sent' WHERE id = %s"
-                    cursor.execute(query, (reminder_id,))
-                    conn.commit()
-                    
+            async with reminders.db_pool.db_pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    # Only pending rows; a reminder cancelled mid-delivery stays cancelled
+                    query = """
+                    UPDATE reminders
+                    SET status = 'sent', lease_owner = NULL, lease_expires_at = NULL{delivery}
+                    WHERE id = %s AND status = 'pending'
+                    """.format(delivery=""",
+                        sent_at = UTC_TIMESTAMP(),
+                        delivery_lateness = GREATEST(0, TIMESTAMPDIFF(SECOND, scheduled_time, UTC_TIMESTAMP()))""" if delivered else "")
+                    await cursor.execute(query, (reminder_id,))
+                    await conn.commit()
+                    reminder_heap.discard(reminder_id)
+                    if user_id is not None:
+                        reminder_list_cache.invalidate(user_id)
+
                     return True
         except Exception as e:
             if attempt < max_retries - 1:  # Don't sleep on the last attempt
                 delay = base_delay * (2 ** attempt)  # Exponential backoff
                 logging.warning(f"⚠️ Attempt {attempt + 1}/{max_retries} failed to mark reminder {reminder_id} as sent. Retrying in {delay} seconds...")
-                time.sleep(delay)
+                await asyncio.sleep(delay)
             else:
                 logging.error(f"❌ Error marking reminder as sent after {max_retries} attempts: {e}")
                 return False
 
-def get_user_reminders(user_id: str, status: str = None) -> list:
+async def get_user_reminders(user_id: str, status: str = None) -> list:
     """Get all reminders for a user, optionally filtered by status"""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
                 if status:
                     query = """
                     SELECT id, content, scheduled_time, timezone, original_timezone, status, created_at
-                    FROM reminders 
+                    FROM reminders
                     WHERE user_id = %s AND status = %s
                     ORDER BY scheduled_time ASC
                     """
-                    cursor.execute(query, (user_id, status))
+                    await cursor.execute(query, (user_id, status))
                 else:
                     query = """
                     SELECT id, content, scheduled_time, timezone, original_timezone, status, created_at
-                    FROM reminders 
+                    FROM reminders
                     WHERE user_id = %s
                     ORDER BY scheduled_time ASC
                     """
-                    cursor.execute(query, (user_id,))
-                
-                reminders = cursor.fetchall()
-                logging.info(f"📋 Found {len(reminders)} reminders for {user_id}")
-                return reminders
+                    await cursor.execute(query, (user_id,))
+
+                reminders_list = await cursor.fetchall()
+                logging.info(f"📋 Found {len(reminders_list)} reminders for {user_id}")
+                return reminders_list
     except Exception as e:
         logging.error(f"❌ Error getting user reminders: {e}")
         return []
 
-def get_reminder_by_content(user_id: str, content: str) -> list:
-    """Search for reminders by content (fuzzy match)"""
+async def get_user_reminders_page(user_id: str, after: tuple = None, limit: int = REMINDER_LIST_PAGE_SIZE) -> tuple:
+    """Get one page of a user's pending reminders in (scheduled_time, id) order.
+
+    after is the keyset cursor of the previous page's last row, so each page is
+    an index range scan however deep the user pages.
+
+    Returns:
+        tuple: (reminders, next_cursor); next_cursor is None on the last page
+    """
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
                 query = """
-                SELECT id, content, scheduled_time, timezone, status, created_at
-                FROM reminders 
-                WHERE user_id = %s 
-                AND content LIKE %s
+                SELECT id, content, scheduled_time, timezone, original_timezone, status, created_at
+                FROM reminders
+                WHERE user_id = %s AND status = 'pending'
+                """
+                params = [user_id]
+                if after is not None:
+                    query += " AND (scheduled_time > %s OR (scheduled_time = %s AND id > %s))"
+                    params += [after[0], after[0], after[1]]
+                # One extra row tells us whether there is a next page
+                query += " ORDER BY scheduled_time ASC, id ASC LIMIT %s"
+                params.append(limit + 1)
+                await cursor.execute(query, params)
+                rows = await cursor.fetchall()
+                page = list(rows[:limit])
+                next_cursor = (page[-1]['scheduled_time'], page[-1]['id']) if len(rows) > limit else None
+                return page, next_cursor
+    except Exception as e:
+        logging.error(f"❌ Error getting reminders page: {e}")
+        return [], None
+
+async def get_reminder_by_content(user_id: str, content: str, limit: int = 10) -> list:
+    """Search a user's pending reminders by content, best match first"""
+    try:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                # Served by the ft_reminders_content FULLTEXT index
+                query = """
+                SELECT id, content, scheduled_time, timezone, status, created_at,
+                       MATCH(content) AGAINST (%s IN NATURAL LANGUAGE MODE) AS relevance
+                FROM reminders
+                WHERE user_id = %s
                 AND status = 'pending'
-                ORDER BY scheduled_time ASC
+                AND MATCH(content) AGAINST (%s IN NATURAL LANGUAGE MODE)
+                ORDER BY relevance DESC, scheduled_time ASC
+                LIMIT %s
                 """
-                cursor.execute(query, (user_id, f"%{content}%"))
-                reminders = cursor.fetchall()
-                logging.info(f"🔍 Found {len(reminders)} reminders matching '{content}' for {user_id}")
-                return reminders
+                await cursor.execute(query, (content, user_id, content, limit))
+                reminders_list = await cursor.fetchall()
+                logging.info(f"🔍 Found {len(reminders_list)} reminders matching '{content}' for {user_id}")
+                return reminders_list
     except Exception as e:
         logging.error(f"❌ Error searching reminders by content: {e}")
         return []
 
-def get_last_created_reminder(user_id: str) -> dict:
+async def get_last_created_reminder(user_id: str) -> dict:
     """Get the most recently created reminder for a user"""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
                 query = """
                 SELECT id, content, scheduled_time, timezone, status, created_at
-                FROM reminders 
+                FROM reminders
                 WHERE user_id = %s
                 ORDER BY created_at DESC
                 LIMIT 1
                 """
-                cursor.execute(query, (user_id,))
-                reminder = cursor.fetchone()
+                await cursor.execute(query, (user_id,))
+                reminder = await cursor.fetchone()
                 if reminder:
                     logging.info(f"📝 Found last created reminder for {user_id}")
                 return reminder
@@ -271,22 +567,27 @@ def get_last_created_reminder(user_id: str) -> dict:
         logging.error(f"❌ Error getting last created reminder: {e}")
         return None
 
-def cancel_reminder(reminder_id: int, cancelled_by: str) -> bool:
+async def cancel_reminder(reminder_id: int, cancelled_by: str) -> bool:
     """Cancel a specific reminder"""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
                 query = """
-                UPDATE reminders 
-                SET status = 'cancelled', 
+                UPDATE reminders
+                SET status = 'cancelled',
                     cancelled_at = UTC_TIMESTAMP(),
                     cancelled_by = %s
                 WHERE id = %s AND status = 'pending'
                 """
-                cursor.execute(query, (cancelled_by, reminder_id))
-                conn.commit()
-                
+                await cursor.execute(query, (cancelled_by, reminder_id))
+                await conn.commit()
+
                 if cursor.rowcount > 0:
+                    reminder_heap.discard(reminder_id)
+                    await cursor.execute("SELECT user_id FROM reminders WHERE id = %s", (reminder_id,))
+                    owner = await cursor.fetchone()
+                    if owner:
+                        reminder_list_cache.invalidate(owner[0])
                     print(f"✅ Cancelled reminder {reminder_id}")
                     return True
                 else:
@@ -296,30 +597,98 @@ def cancel_reminder(reminder_id: int, cancelled_by: str) -> bool:
         logging.error(f"❌ Error cancelling reminder: {e}")
         return False
 
-def get_any_reminder_timezone(user_id):
-    """Get timezone from any existing reminder (including cancelled ones)"""
+async def cancel_reminders(user_id: str, reminder_ids: list, cancelled_by: str) -> list:
+    """Cancel several of a user's pending reminders in one statement.
+
+    Returns:
+        list: The reminders actually cancelled ({'id', 'content'}); empty if none matched or on error
+    """
+    reminder_ids = list(dict.fromkeys(reminder_ids))
+    if not reminder_ids:
+        return []
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-                # Query to get timezone from any reminder for this user
-                query = """
-                    SELECT timezone 
-                    FROM reminders 
-                    WHERE user_id = %s 
-                    AND timezone IS NOT NULL 
-                    AND timezone != 'UTC'
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """
-                
-                cursor.execute(query, (user_id,))
-                result = cursor.fetchone()
-                
-                if result and result['timezone']:
-                    logging.info(f"✅ Found timezone from any reminder: {result['timezone']}")
-                    return result['timezone']
-                
-                return None
+        async with reminders.db_pool.db_pool.acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    # Lock the rows first so the confirmation lists exactly what the UPDATE changed
+                    placeholders = ', '.join(['%s'] * len(reminder_ids))
+                    await cursor.execute(f"""
+                    SELECT id, content FROM reminders
+                    WHERE user_id = %s AND status = 'pending' AND id IN ({placeholders})
+                    FOR UPDATE
+                    """, (user_id, *reminder_ids))
+                    cancelled = await cursor.fetchall()
+                    if cancelled:
+                        ids = [reminder['id'] for reminder in cancelled]
+                        placeholders = ', '.join(['%s'] * len(ids))
+                        await cursor.execute(f"""
+                        UPDATE reminders
+                        SET status = 'cancelled',
+                            cancelled_at = UTC_TIMESTAMP(),
+                            cancelled_by = %s
+                        WHERE id IN ({placeholders})
+                        """, (cancelled_by, *ids))
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+        for reminder in cancelled:
+            reminder_heap.discard(reminder['id'])
+        if cancelled:
+            reminder_list_cache.invalidate(user_id)
+        print(f"✅ Cancelled {len(cancelled)} reminders for {user_id}")
+        return list(cancelled)
     except Exception as e:
-        logging.error(f"❌ Error getting any reminder timezone: {e}")
-        return None 
\ No newline at end of file
+        logging.error(f"❌ Error cancelling reminders: {e}")
+        return []
+
+async def archive_reminders(retention_days=REMINDER_ARCHIVE_RETENTION_DAYS, batch_size=REMINDER_ARCHIVE_BATCH_SIZE):
+    """Move sent/cancelled reminders older than the retention window into reminders_archive.
+
+    Works in batches of batch_size rows, each in its own transaction, so the
+    hot table is never locked for long. Returns the number of rows moved.
+    """
+    moved = 0
+    async with reminders.db_pool.db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            # Copy only the columns both tables have, so a column added to reminders later doesn't break archiving
+            await cursor.execute("SHOW COLUMNS FROM reminders_archive")
+            archive_columns = {row[0] for row in await cursor.fetchall()}
+            await cursor.execute("SHOW COLUMNS FROM reminders")
+            columns = ", ".join(f"`{row[0]}`" for row in await cursor.fetchall() if row[0] in archive_columns)
+        while True:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute("""
+                    SELECT id FROM reminders
+                    WHERE status IN ('sent', 'cancelled')
+                    AND COALESCE(cancelled_at, sent_at, scheduled_time) < UTC_TIMESTAMP() - INTERVAL %s DAY
+                    AND NOT EXISTS (SELECT 1 FROM reminders_archive WHERE reminders_archive.id = reminders.id)
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                    """, (retention_days, batch_size))
+                    ids = [row[0] for row in await cursor.fetchall()]
+                    if ids:
+                        placeholders = ', '.join(['%s'] * len(ids))
+                        # Plain INSERT: if any row can't be copied the batch rolls back rather than deleting it unarchived.
+                        # Ids already in the archive (e.g. reused after an AUTO_INCREMENT reset) are left out above
+                        await cursor.execute(f"""
+                        INSERT INTO reminders_archive ({columns}, archived_at)
+                        SELECT {columns}, UTC_TIMESTAMP() FROM reminders WHERE id IN ({placeholders})
+                        """, ids)
+                        await cursor.execute(f"DELETE FROM reminders WHERE id IN ({placeholders})", ids)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            moved += len(ids)
+            if len(ids) < batch_size:
+                break
+            # Give other queries a turn between batches
+            await asyncio.sleep(0)
+    if moved:
+        logging.info(f"🗄️ Archived {moved} sent/cancelled reminders older than {retention_days} days")
+    return moved
@@ -0,0 +1,239 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pytz
+
+from .timer_heap import _as_utc
+
+class DeliveryStats:
+    """Lateness counters for delivered reminders, reset after each burst is reported"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.delivered = 0
+        self.failed = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def record(self, lateness_seconds):
+        self.delivered += 1
+        self.total_lateness += lateness_seconds
+        self.max_lateness = max(self.max_lateness, lateness_seconds)
+
+    @property
+    def average_lateness(self):
+        return self.total_lateness / self.delivered if self.delivered else 0.0
+
+class ReminderDeliveryPipeline:
+    """Staged delivery of due reminders: generate -> send -> mark sent.
+
+    Each stage has its own queue and a fixed pool of workers, so a burst of N
+    reminders drains in roughly N / concurrency round trips instead of one
+    reminder at a time. With generate_batch, co-due reminders are written in
+    one LLM call per batch_size reminders, falling back to generate for any
+    reminder the batch reply leaves out.
+    """
+
+    def __init__(self, generate, send, mark_sent, concurrency=10, release=None, generate_batch=None, batch_size=1, render_local=None):
+        self._generate = generate    # (content, user_id) -> str, blocking; runs in a worker thread
+        self._generate_batch = generate_batch  # optional ([reminder, ...]) -> {reminder_id: str}, blocking
+        self._render_local = render_local  # optional (reminder) -> str or None; a string skips the LLM entirely
+        self.batch_size = max(1, int(batch_size))
+        self._send = send            # (user_id, notification, **kwargs) -> bool, blocking; runs in a worker thread
+        self._mark_sent = mark_sent  # async (reminder_id, user_id=None, delivered=True) -> bool
+        self._release = release      # optional async (reminder_id) -> bool, frees a claim after an error
+        self.concurrency = max(1, int(concurrency))
+        # Cap on reminders held in memory at once; the rest stay claimable in the database
+        self.max_in_flight = self.concurrency * 4
+        self._generate_queue = asyncio.Queue()
+        self._send_queue = asyncio.Queue()
+        self._mark_queue = asyncio.Queue()
+        self._in_flight = set()
+        self._workers = []
+        self.stats = DeliveryStats()
+        # Dedicated threads so the blocking OpenAI/Discord calls aren't capped by the default executor
+        self._executor = ThreadPoolExecutor(max_workers=2 * self.concurrency, thread_name_prefix="reminder-delivery")
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def start(self):
+        """Spawn the stage workers on the running loop"""
+        if self._workers:
+            return
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._generate_worker()))
+            self._workers.append(asyncio.create_task(self._send_worker()))
+        # Marking is a single indexed UPDATE, so it needs far fewer workers
+        for _ in range(max(1, self.concurrency // 4)):
+            self._workers.append(asyncio.create_task(self._mark_worker()))
+        logging.info(f"📬 Reminder delivery pipeline started with concurrency {self.concurrency}")
+
+    async def stop(self):
+        """Cancel the stage workers"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._executor.shutdown(wait=False)
+
+    def submit(self, reminder):
+        """Queue a due reminder for delivery; returns False if it is already in flight"""
+        if reminder['id'] in self._in_flight:
+            return False
+        self._in_flight.add(reminder['id'])
+        reminder = dict(reminder)
+        if reminder.get('notification_text'):
+            # Written ahead of time by the look-ahead pass; go straight to sending
+            reminder['notification'] = reminder['notification_text']
+            self._send_queue.put_nowait(reminder)
+            return True
+        notification = self._render_local(reminder) if self._render_local else None
+        if notification:
+            reminder['notification'] = notification
+            self._send_queue.put_nowait(reminder)
+        else:
+            self._generate_queue.put_nowait(reminder)
+        return True
+
+    def submit_digest(self, user_id, reminders, notification):
+        """Queue one message covering several of a user's reminders; each is marked sent once it goes out"""
+        members = [dict(reminder) for reminder in reminders if reminder['id'] not in self._in_flight]
+        if not members:
+            return False
+        for member in members:
+            self._in_flight.add(member['id'])
+        self._send_queue.put_nowait({
+            'id': members[0]['id'],
+            'user_id': user_id,
+            'scheduled_time': members[0]['scheduled_time'],
+            'notification': notification,
+            'members': members
+        })
+        return True
+
+    def is_in_flight(self, reminder_id):
+        return reminder_id in self._in_flight
+
+    def available_capacity(self):
+        """How many more reminders can be submitted before the pipeline is full"""
+        return max(0, self.max_in_flight - len(self._in_flight))
+
+    def queue_sizes(self):
+        """Current backlog per stage, for logging and saturation checks"""
+        return {
+            'generate': self._generate_queue.qsize(),
+            'send': self._send_queue.qsize(),
+            'mark': self._mark_queue.qsize()
+        }
+
+    @staticmethod
+    def _members(reminder):
+        # A digest stands in for several reminders; anything else is just itself
+        return reminder.get('members') or [reminder]
+
+    def _finish(self, reminder, delivered):
+        for member in self._members(reminder):
+            self._in_flight.discard(member['id'])
+            if not delivered:
+                self.stats.failed += 1
+        # Report once the burst has fully drained
+        if not self._in_flight and (self.stats.delivered or self.stats.failed):
+            logging.info(
+                f"📬 Delivery burst drained: {self.stats.delivered} sent, {self.stats.failed} failed, "
+                f"avg lateness {self.stats.average_lateness:.1f}s, max lateness {self.stats.max_lateness:.1f}s"
+            )
+            self.stats.reset()
+
+    async def _abandon(self, reminder):
+        # Let another pass (or another process) retry instead of waiting out the lease
+        if self._release:
+            for member in self._members(reminder):
+                try:
+                    await self._release(member['id'])
+                except Exception as e:
+                    logging.error(f"❌ Error releasing reminder {member.get('id', 'unknown')}: {e}")
+        self._finish(reminder, delivered=False)
+
+    async def _generate_one(self, reminder):
+        try:
+            reminder['notification'] = await self._run_blocking(self._generate, reminder['content'], reminder['user_id'])
+            self._send_queue.put_nowait(reminder)
+        except Exception as e:
+            logging.error(f"❌ Error generating notification for reminder {reminder.get('id', 'unknown')}: {e}")
+            await self._abandon(reminder)
+
+    async def _generate_worker(self):
+        while True:
+            # Everything submitted in the same scheduler tick is already queued,
+            # so take up to batch_size of it without waiting for more
+            batch = [await self._generate_queue.get()]
+            while len(batch) < self.batch_size and not self._generate_queue.empty():
+                batch.append(self._generate_queue.get_nowait())
+            try:
+                pending = batch
+                if self._generate_batch and len(batch) > 1:
+                    try:
+                        notifications = await self._run_blocking(self._generate_batch, batch)
+                    except Exception as e:
+                        logging.error(f"❌ Error generating batch of {len(batch)} notifications: {e}")
+                        notifications = {}
+                    pending = []
+                    for reminder in batch:
+                        if reminder['id'] in notifications:
+                            reminder['notification'] = notifications[reminder['id']]
+                            self._send_queue.put_nowait(reminder)
+                        else:
+                            pending.append(reminder)
+                    if pending:
+                        logging.info(f"📬 Batch covered {len(batch) - len(pending)}/{len(batch)} reminders; generating the rest one by one")
+                await asyncio.gather(*(self._generate_one(reminder) for reminder in pending))
+            finally:
+                for _ in batch:
+                    self._generate_queue.task_done()
+
+    async def _send_worker(self):
+        while True:
+            reminder = await self._send_queue.get()
+            try:
+                send_success = await self._run_blocking(self._send, reminder['user_id'], reminder['notification'], is_reminder_notification=True)
+                reminder['send_success'] = send_success
+                if send_success:
+                    now = datetime.now(pytz.UTC)
+                    for member in self._members(reminder):
+                        lateness = (now - _as_utc(member['scheduled_time'])).total_seconds()
+                        member['lateness'] = lateness
+                        self.stats.record(lateness)
+                        logging.info(f"⏱️ Reminder {member['id']} delivered {lateness:.1f}s after its due time")
+                else:
+                    logging.error(f"❌ Failed to send reminder {reminder['id']} to {reminder['user_id']}. Marking as sent to avoid retry loop.")
+                self._mark_queue.put_nowait(reminder)
+            except Exception as e:
+                logging.error(f"❌ Error sending reminder {reminder.get('id', 'unknown')}: {e}")
+                await self._abandon(reminder)
+            finally:
+                self._send_queue.task_done()
+
+    async def _mark_worker(self):
+        while True:
+            reminder = await self._mark_queue.get()
+            try:
+                marked = True
+                for member in self._members(reminder):
+                    marked = await self._mark_sent(member['id'], user_id=reminder['user_id'], delivered=reminder['send_success']) and marked
+                if reminder['send_success']:
+                    if marked:
+                        logging.info(f"✅ Sent reminder {reminder['id']} to {reminder['user_id']}")
+                    else:
+                        logging.error(f"❌ Sent reminder {reminder['id']} but failed to mark as sent")
+                self._finish(reminder, delivered=reminder['send_success'])
+            except Exception as e:
+                logging.error(f"❌ Error marking reminder {reminder.get('id', 'unknown')} as sent: {e}")
+                self._finish(reminder, delivered=reminder['send_success'])
+            finally:
+                self._mark_queue.task_done()
@@ -0,0 +1,265 @@
+import difflib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+import pytz
+
+# Add the parent directory to the path to help with imports
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from config import LOCATION_CACHE_FILE, LOCATION_CACHE_SIZE
+
+# Offline place name -> IANA timezone lookup used by extract_timezone_from_location.
+# Cities come from the zone names themselves (America/New_York -> "new york") plus
+# the table below; countries come from pytz's country tables; anything the LLM
+# has resolved before is kept in a small JSON file so it is never asked twice.
+
+# Time zone names and abbreviations people actually type
+_ZONE_ALIASES = {
+    'pacific': 'America/Los_Angeles', 'pacific time': 'America/Los_Angeles', 'pt': 'America/Los_Angeles',
+    'pst': 'America/Los_Angeles', 'pdt': 'America/Los_Angeles',
+    'mountain': 'America/Denver', 'mountain time': 'America/Denver', 'mt': 'America/Denver',
+    'mst': 'America/Denver', 'mdt': 'America/Denver', 'arizona time': 'America/Phoenix',
+    'central': 'America/Chicago', 'central time': 'America/Chicago', 'ct': 'America/Chicago',
+    'cst': 'America/Chicago', 'cdt': 'America/Chicago',
+    'eastern': 'America/New_York', 'eastern time': 'America/New_York', 'et': 'America/New_York',
+    'est': 'America/New_York', 'edt': 'America/New_York',
+    'alaska time': 'America/Anchorage', 'akst': 'America/Anchorage', 'akdt': 'America/Anchorage',
+    'hawaii time': 'Pacific/Honolulu', 'hst': 'Pacific/Honolulu',
+    'atlantic time': 'America/Halifax', 'ast': 'America/Halifax', 'adt': 'America/Halifax',
+    'newfoundland time': 'America/St_Johns', 'nst': 'America/St_Johns',
+    'utc': 'UTC', 'gmt': 'Europe/London', 'bst': 'Europe/London', 'wet': 'Europe/Lisbon',
+    'cet': 'Europe/Paris', 'cest': 'Europe/Paris', 'eet': 'Europe/Athens', 'eest': 'Europe/Athens',
+    'msk': 'Europe/Moscow', 'ist': 'Asia/Kolkata', 'pkt': 'Asia/Karachi', 'sgt': 'Asia/Singapore',
+    'hkt': 'Asia/Hong_Kong', 'jst': 'Asia/Tokyo', 'kst': 'Asia/Seoul', 'china time': 'Asia/Shanghai',
+    'awst': 'Australia/Perth', 'acst': 'Australia/Adelaide', 'aest': 'Australia/Sydney',
+    'aedt': 'Australia/Sydney', 'nzst': 'Pacific/Auckland', 'nzdt': 'Pacific/Auckland'
+}
+
+_US_STATES = {
+    'alabama': 'America/Chicago', 'alaska': 'America/Anchorage', 'arizona': 'America/Phoenix',
+    'arkansas': 'America/Chicago', 'california': 'America/Los_Angeles', 'colorado': 'America/Denver',
+    'connecticut': 'America/New_York', 'delaware': 'America/New_York', 'florida': 'America/New_York',
+    'georgia': 'America/New_York', 'hawaii': 'Pacific/Honolulu', 'idaho': 'America/Boise',
+    'illinois': 'America/Chicago', 'indiana': 'America/Indiana/Indianapolis', 'iowa': 'America/Chicago',
+    'kansas': 'America/Chicago', 'kentucky': 'America/New_York', 'louisiana': 'America/Chicago',
+    'maine': 'America/New_York', 'maryland': 'America/New_York', 'massachusetts': 'America/New_York',
+    'michigan': 'America/Detroit', 'minnesota': 'America/Chicago', 'mississippi': 'America/Chicago',
+    'missouri': 'America/Chicago', 'montana': 'America/Denver', 'nebraska': 'America/Chicago',
+    'nevada': 'America/Los_Angeles', 'new hampshire': 'America/New_York', 'new jersey': 'America/New_York',
+    'new mexico': 'America/Denver', 'new york state': 'America/New_York', 'north carolina': 'America/New_York',
+    'north dakota': 'America/Chicago', 'ohio': 'America/New_York', 'oklahoma': 'America/Chicago',
+    'oregon': 'America/Los_Angeles', 'pennsylvania': 'America/New_York', 'rhode island': 'America/New_York',
+    'south carolina': 'America/New_York', 'south dakota': 'America/Chicago', 'tennessee': 'America/Chicago',
+    'texas': 'America/Chicago', 'utah': 'America/Denver', 'vermont': 'America/New_York',
+    'virginia': 'America/New_York', 'washington': 'America/Los_Angeles', 'washington state': 'America/Los_Angeles',
+    'west virginia': 'America/New_York', 'wisconsin': 'America/Chicago', 'wyoming': 'America/Denver',
+    'washington dc': 'America/New_York', 'dc': 'America/New_York', 'district of columbia': 'America/New_York',
+    'puerto rico': 'America/Puerto_Rico'
+}
+
+# Well-known cities that aren't zone names themselves
+_CITIES = {
+    'san francisco': 'America/Los_Angeles', 'sf': 'America/Los_Angeles',
+    'san jose': 'America/Los_Angeles', 'san diego': 'America/Los_Angeles', 'sacramento': 'America/Los_Angeles',
+    'seattle': 'America/Los_Angeles', 'portland': 'America/Los_Angeles', 'las vegas': 'America/Los_Angeles',
+    'la': 'America/Los_Angeles', 'salt lake city': 'America/Denver', 'albuquerque': 'America/Denver',
+    'dallas': 'America/Chicago', 'houston': 'America/Chicago', 'austin': 'America/Chicago',
+    'san antonio': 'America/Chicago', 'minneapolis': 'America/Chicago', 'st louis': 'America/Chicago',
+    'kansas city': 'America/Chicago', 'nashville': 'America/Chicago', 'new orleans': 'America/Chicago',
+    'milwaukee': 'America/Chicago', 'oklahoma city': 'America/Chicago', 'memphis': 'America/Chicago',
+    'nyc': 'America/New_York', 'new york city': 'America/New_York', 'manhattan': 'America/New_York',
+    'brooklyn': 'America/New_York', 'boston': 'America/New_York', 'philadelphia': 'America/New_York',
+    'philly': 'America/New_York', 'atlanta': 'America/New_York', 'miami': 'America/New_York',
+    'orlando': 'America/New_York', 'tampa': 'America/New_York', 'charlotte': 'America/New_York',
+    'pittsburgh': 'America/New_York', 'baltimore': 'America/New_York', 'cleveland': 'America/New_York',
+    'columbus': 'America/New_York', 'raleigh': 'America/New_York', 'buffalo': 'America/New_York',
+    'honolulu': 'Pacific/Honolulu', 'ottawa': 'America/Toronto', 'montreal': 'America/Toronto',
+    'quebec': 'America/Toronto', 'calgary': 'America/Edmonton', 'guadalajara': 'America/Mexico_City',
+    'rio de janeiro': 'America/Sao_Paulo', 'rio': 'America/Sao_Paulo', 'brasilia': 'America/Sao_Paulo',
+    'quito': 'America/Guayaquil', 'medellin': 'America/Bogota',
+    'manchester': 'Europe/London', 'birmingham': 'Europe/London', 'liverpool': 'Europe/London',
+    'edinburgh': 'Europe/London', 'glasgow': 'Europe/London', 'cardiff': 'Europe/London',
+    'belfast': 'Europe/London', 'munich': 'Europe/Berlin', 'frankfurt': 'Europe/Berlin',
+    'hamburg': 'Europe/Berlin', 'cologne': 'Europe/Berlin', 'barcelona': 'Europe/Madrid',
+    'valencia': 'Europe/Madrid', 'seville': 'Europe/Madrid', 'milan': 'Europe/Rome',
+    'venice': 'Europe/Rome', 'florence': 'Europe/Rome', 'naples': 'Europe/Rome',
+    'lyon': 'Europe/Paris', 'marseille': 'Europe/Paris', 'nice': 'Europe/Paris',
+    'geneva': 'Europe/Zurich', 'porto': 'Europe/Lisbon', 'krakow': 'Europe/Warsaw',
+    'st petersburg': 'Europe/Moscow', 'saint petersburg': 'Europe/Moscow', 'kiev': 'Europe/Kiev',
+    'kyiv': 'Europe/Kiev', 'rotterdam': 'Europe/Amsterdam', 'the hague': 'Europe/Amsterdam',
+    'antwerp': 'Europe/Brussels', 'gothenburg': 'Europe/Stockholm',
+    'delhi': 'Asia/Kolkata', 'new delhi': 'Asia/Kolkata', 'mumbai': 'Asia/Kolkata',
+    'bombay': 'Asia/Kolkata', 'bangalore': 'Asia/Kolkata', 'bengaluru': 'Asia/Kolkata',
+    'chennai': 'Asia/Kolkata', 'hyderabad': 'Asia/Kolkata', 'pune': 'Asia/Kolkata',
+    'beijing': 'Asia/Shanghai', 'shenzhen': 'Asia/Shanghai', 'guangzhou': 'Asia/Shanghai',
+    'chengdu': 'Asia/Shanghai', 'osaka': 'Asia/Tokyo', 'kyoto': 'Asia/Tokyo', 'busan': 'Asia/Seoul',
+    'abu dhabi': 'Asia/Dubai', 'hanoi': 'Asia/Bangkok', 'ho chi minh city': 'Asia/Ho_Chi_Minh',
+    'saigon': 'Asia/Ho_Chi_Minh', 'tel aviv': 'Asia/Jerusalem', 'islamabad': 'Asia/Karachi',
+    'lahore': 'Asia/Karachi', 'bali': 'Asia/Makassar', 'cebu': 'Asia/Manila',
+    'cape town': 'Africa/Johannesburg', 'durban': 'Africa/Johannesburg', 'marrakech': 'Africa/Casablanca',
+    'canberra': 'Australia/Sydney', 'gold coast': 'Australia/Brisbane', 'wellington': 'Pacific/Auckland',
+    'christchurch': 'Pacific/Auckland'
+}
+
+# Country names that differ from pytz's, plus multi-zone countries pinned to their main zone
+_COUNTRIES = {
+    'uk': 'Europe/London', 'united kingdom': 'Europe/London', 'britain': 'Europe/London',
+    'great britain': 'Europe/London', 'england': 'Europe/London', 'scotland': 'Europe/London',
+    'wales': 'Europe/London', 'northern ireland': 'Europe/London',
+    'korea': 'Asia/Seoul', 'south korea': 'Asia/Seoul', 'north korea': 'Asia/Pyongyang',
+    'uae': 'Asia/Dubai', 'emirates': 'Asia/Dubai', 'holland': 'Europe/Amsterdam',
+    'czech republic': 'Europe/Prague', 'czechia': 'Europe/Prague', 'vietnam': 'Asia/Ho_Chi_Minh',
+    'russia': 'Europe/Moscow', 'canada': 'America/Toronto', 'australia': 'Australia/Sydney',
+    'brazil': 'America/Sao_Paulo', 'ukraine': 'Europe/Kiev', 'uzbekistan': 'Asia/Tashkent',
+    'laos': 'Asia/Vientiane', 'iran': 'Asia/Tehran', 'syria': 'Asia/Damascus',
+    'taiwan': 'Asia/Taipei', 'hong kong': 'Asia/Hong_Kong', 'macau': 'Asia/Macau',
+    'ivory coast': 'Africa/Abidjan', 'congo': 'Africa/Kinshasa', 'drc': 'Africa/Kinshasa'
+}
+
+# Countries whose zones are too far apart to guess from the name alone
+_AMBIGUOUS_COUNTRIES = {'AQ', 'UM', 'US'}
+
+# Phrases wrapped around the place name in replies like "I'm in Seattle"
+_LEADING_PHRASES = re.compile(
+    r"^(?:(?:please\s+)?(?:change|update|set|switch)\s+(?:my\s+|the\s+)?(?:time[\s-]?zone|location)\s+to\s+"
+    r"|(?:i'?m|i am|i live|i'?m living|we'?re|we are|currently)\s+(?:in|at|near|from|based in)\s+"
+    r"|(?:i'?m|i am)\s+"
+    r"|(?:in|near|from|at)\s+"
+    r"|(?:it'?s|my location is|my time[\s-]?zone is|location|time[\s-]?zone)\s*(?::\s*|is\s+)?)+"
+)
+_TRAILING_PHRASES = re.compile(r"(?:\s+(?:time[\s-]?zone|time|area|city|usa|us|please|thanks|thank you))+$")
+_UTC_OFFSET = re.compile(r"^(?:utc|gmt)\s*([+-])\s*(\d{1,2})(?::?00)?$")
+
+def _normalize(text):
+    """Lowercase, strip accents and punctuation, and drop filler around the place name"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    text = re.sub(r"[^\w\s,+:'/-]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip(" ,")
+    text = _LEADING_PHRASES.sub("", text)
+    text = _TRAILING_PHRASES.sub("", text)
+    return text.replace("the ", "", 1) if text.startswith("the ") else text
+
+class TimezoneGazetteer:
+    """Offline place name -> IANA timezone index with an LRU and a persistent cache of LLM answers"""
+
+    def __init__(self, cache_file=None, cache_size=1024):
+        self._cache_file = cache_file
+        self._cache_size = cache_size
+        self._index = None
+        self._names = None
+        self._learned = {}              # normalized location -> timezone resolved by the LLM
+        self._lru = OrderedDict()       # normalized location -> timezone or None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        # Built once on first use; later lookups only read the dicts
+        index = {}
+        for code, name in pytz.country_names.items():
+            zones = pytz.country_timezones.get(code, [])
+            if zones and code not in _AMBIGUOUS_COUNTRIES:
+                index[_normalize(name)] = zones[0]
+        for zone in pytz.common_timezones:
+            city = zone.rsplit('/', 1)[-1].replace('_', ' ').lower()
+            if '/' in zone and not city.startswith('gmt'):
+                index.setdefault(city, zone)
+            index[zone.lower()] = zone
+        for table in (_COUNTRIES, _US_STATES, _CITIES, _ZONE_ALIASES):
+            for name, zone in table.items():
+                if zone in pytz.all_timezones_set:
+                    index[name] = zone
+        self._index = index
+        self._names = list(index)
+        self._learned = self._load_learned()
+        logging.info(f"🌎 Timezone gazetteer loaded {len(index)} places and {len(self._learned)} learned locations")
+
+    def _load_learned(self):
+        if not self._cache_file or not os.path.exists(self._cache_file):
+            return {}
+        try:
+            with open(self._cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {k: v for k, v in data.items() if v in pytz.all_timezones_set}
+        except Exception as e:
+            logging.error(f"❌ Could not read location cache {self._cache_file}: {e}")
+            return {}
+
+    def _save_learned(self):
+        try:
+            tmp_path = f"{self._cache_file}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._learned, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self._cache_file)
+        except Exception as e:
+            logging.error(f"❌ Could not write location cache {self._cache_file}: {e}")
+
+    def _resolve(self, key):
+        match = _UTC_OFFSET.match(key)
+        if match:
+            # IANA's Etc zones use inverted signs: UTC+8 is Etc/GMT-8
+            sign, hours = match.groups()
+            zone = 'UTC' if int(hours) == 0 else f"Etc/GMT{'-' if sign == '+' else '+'}{int(hours)}"
+            return zone if zone in pytz.all_timezones_set else None
+        if key in self._index:
+            return self._index[key]
+        if key in self._learned:
+            return self._learned[key]
+        # "Austin, Texas" / "Lyon, France": use the parts we know, but only if they
+        # agree; "Paris, Texas" or "Hyderabad, Pakistan" are left to the LLM
+        parts = [part.strip() for part in key.split(',') if part.strip()]
+        if len(parts) > 1:
+            zones = {self._index.get(part) or self._learned.get(part) for part in parts} - {None}
+            if len(zones) == 1:
+                return zones.pop()
+            if zones:
+                return None
+        # Typos ("Seatle", "Londn"); short strings are too easy to mismatch
+        if len(key) >= 5:
+            close = difflib.get_close_matches(key, self._names, n=1, cutoff=0.85)
+            if close:
+                return self._index[close[0]]
+        return None
+
+    def lookup(self, location):
+        """Return the IANA timezone for a place name, or None if it needs the LLM"""
+        if not location:
+            return None
+        key = _normalize(location)
+        if not key:
+            return None
+        with self._lock:
+            if self._index is None:
+                self._build()
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+            zone = self._resolve(key)
+            self._lru[key] = zone
+            if len(self._lru) > self._cache_size:
+                self._lru.popitem(last=False)
+        return zone
+
+    def remember(self, location, timezone):
+        """Keep an LLM resolution so the same place is answered offline next time"""
+        key = _normalize(location or "")
+        if not key or timezone not in pytz.all_timezones_set:
+            return
+        with self._lock:
+            if self._index is None:
+                self._build()
+            self._lru[key] = timezone
+            if self._learned.get(key) == timezone:
+                return
+            self._learned[key] = timezone
+            if self._cache_file:
+                self._save_learned()
+
+# Shared gazetteer used by extract_timezone_from_location
+timezone_gazetteer = TimezoneGazetteer(LOCATION_CACHE_FILE, LOCATION_CACHE_SIZE)
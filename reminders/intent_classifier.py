@@ -0,0 +1,128 @@
+import logging
+import re
+import threading
+from typing import Tuple
+
+# Local rule-based front end for detect_reminder_operation. Clear-cut messages
+# are settled here without an OpenAI round trip; anything scoring below the
+# confidence threshold still goes to the LLM.
+
+_CREATE_PATTERNS = [
+    r"^(?:hey\s+cali[,!]?\s+)?(?:please\s+|can you\s+|could you\s+|would you\s+)*(?:remind me|set (?:a |an )?reminder|add (?:a )?reminder|create (?:a )?reminder)\b",
+    r"^(?:please\s+)?don'?t let me forget\b",
+]
+# Reminder-like, but just as often ordinary advice ("don't forget to handle errors");
+# scored below the threshold so the LLM makes the call
+_WEAK_CREATE_PATTERNS = [
+    r"^(?:please\s+)?don'?t forget to\b",
+]
+_LIST_PATTERNS = [
+    r"^(?:can you\s+|could you\s+|please\s+)*(?:show|list|view|see|check|display|give|tell)(?: me)?(?: all)?(?: of)? (?:my|the|all my|all of my) (?:current |active |pending |upcoming )?reminders\b",
+    r"^what(?:'s| is| are|'re)? (?:all )?(?:my|the) (?:current |active |pending |upcoming )?reminders\b",
+    r"^(?:my )?reminders\s*\??$",
+    r"^do i have (?:any )?reminders\b",
+]
+_CANCEL_PATTERNS = [
+    r"^(?:please\s+|can you\s+|could you\s+)*(?:cancel|delete|remove|clear)\b.*\bmy\s+(?:[\w'-]+\s+){0,3}reminders?\b",
+    r"^(?:please\s+)?(?:cancel|delete|remove) (?:that|this|it)\s*[.!]?$",
+]
+_LOCATION_PATTERNS = [
+    r"^(?:please\s+)?(?:change|update|set|switch)\s+my\s+(?:time[\s-]?zone|location)\s+to\b\s*\w+",
+]
+# Words that make a message plausibly reminder-related; without any of them
+# (and without a time expression) a message is treated as ordinary chat
+_REMINDER_KEYWORDS = re.compile(
+    r"\b(?:remind\w*|reminders?|remember|forget|cancel\w*|alarm|notify|notification|alert|schedul\w*|time[\s-]?zone|location)\b"
+)
+_TIME_EXPRESSION = re.compile(
+    r"\b(?:tomorrow|tonight|today|noon|midnight|next (?:week|month|monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+    r"|in (?:a|an|\d+|one|two|three|five|ten|fifteen|twenty|thirty) (?:second|minute|hour|day|week|month|year)s?"
+    r"|at \d{1,2}(?::\d{2})?\s*(?:am|pm)?)\b"
+)
+
+_stats_lock = threading.Lock()
+_stats = {'local': 0, 'llm': 0}
+_REPORT_EVERY = 50
+
+def classify_reminder_operation(text: str) -> Tuple[str, float]:
+    """Classify a message locally.
+
+    Returns:
+        Tuple[str, float]: Operation ('create', 'list', 'cancel', 'location',
+        'time' or 'none') and a confidence between 0 and 1
+
+    Ordinary chat that merely mentions these words must stay below the threshold:
+
+    >>> classify_reminder_operation("How do I change the timezone in Django to UTC?")[0] != 'location'
+    True
+    >>> classify_reminder_operation("how do I set the location field to null in SQL")[0] != 'location'
+    True
+    >>> classify_reminder_operation("This song reminded me to call my mom")[1] < 0.85
+    True
+    >>> classify_reminder_operation("Don't forget to include error handling in the code")[1] < 0.85
+    True
+    >>> classify_reminder_operation("Delete the reminders table from my schema")[0] != 'cancel'
+    True
+    >>> classify_reminder_operation("change my timezone to Europe/London")
+    ('location', 0.9)
+    >>> classify_reminder_operation("cancel my gym reminder")
+    ('cancel', 0.95)
+    """
+    text_lower = text.strip().lower()
+    if not text_lower:
+        return 'none', 1.0
+
+    # Time queries reuse the time handler's own patterns
+    from reminders.time_handler import _parse_time_query
+    time_type, _ = _parse_time_query(text)
+    if time_type != 'unknown':
+        return 'time', 1.0
+
+    # A bare "cancel" is not a reminder request (matches the LLM prompt's rule)
+    if re.fullmatch(r"cancel\s*[.!]?", text_lower):
+        return 'none', 0.95
+
+    for pattern in _LOCATION_PATTERNS:
+        if re.search(pattern, text_lower):
+            return 'location', 0.9
+    for pattern in _CANCEL_PATTERNS:
+        if re.search(pattern, text_lower):
+            return 'cancel', 0.95
+    for pattern in _LIST_PATTERNS:
+        if re.search(pattern, text_lower):
+            return 'list', 0.95
+
+    has_keyword = bool(_REMINDER_KEYWORDS.search(text_lower))
+    has_time = bool(_TIME_EXPRESSION.search(text_lower))
+    for pattern in _CREATE_PATTERNS:
+        if re.search(pattern, text_lower):
+            # "remind me what we said" is chat; "remind me to ..." or a time makes it a reminder
+            if has_time or re.search(r"\b(?:remind me|reminder|forget)\s+(?:to|that|at|in|on|for)\b", text_lower):
+                return 'create', 0.95
+            return 'create', 0.6
+    for pattern in _WEAK_CREATE_PATTERNS:
+        if re.search(pattern, text_lower):
+            return 'create', 0.6
+    if not has_keyword and not has_time:
+        return 'none', 0.9
+    # Mentions reminders or a time but fits no clear pattern: let the LLM decide
+    return 'none', 0.3 if has_keyword else 0.5
+
+def record_classification(source: str):
+    """Count a local ('local') or LLM ('llm') decision and periodically log the hit rate"""
+    with _stats_lock:
+        _stats[source] += 1
+        total = _stats['local'] + _stats['llm']
+        local = _stats['local']
+    if total % _REPORT_EVERY == 0:
+        logging.info(f"🧭 Intent classifier local hit rate: {local}/{total} ({local / total:.0%})")
+
+def get_classifier_stats() -> dict:
+    """Local vs LLM decision counts and the local hit rate"""
+    with _stats_lock:
+        total = _stats['local'] + _stats['llm']
+        return {
+            'local': _stats['local'],
+            'llm': _stats['llm'],
+            'hit_rate': _stats['local'] / total if total else 0.0
+        }
@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import REMINDER_LIST_CACHE_TTL, REMINDER_LIST_CACHE_MAX_USERS
+
+class ReminderListCache:
+    """Formatted reminder list pages per user, keyed by keyset cursor.
+
+    Entries are dropped when the user's reminders change (save, cancel, send,
+    timezone update) and otherwise expire after a short TTL, since the text
+    contains relative times ("in 5 minutes") and Today/Tomorrow headings.
+    The least recently listed users are evicted once max_users is reached.
+    """
+
+    def __init__(self, ttl, max_users):
+        self.ttl = ttl
+        self.max_users = max(1, int(max_users))
+        self._pages = OrderedDict()  # user_id -> {cursor: (page, expires_at)}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, cursor):
+        with self._lock:
+            user_pages = self._pages.get(user_id)
+            if user_pages is None:
+                return None
+            entry = user_pages.get(cursor)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del user_pages[cursor]
+                return None
+            self._pages.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user_id, cursor, page):
+        with self._lock:
+            user_pages = self._pages.setdefault(user_id, {})
+            user_pages[cursor] = (page, time.monotonic() + self.ttl)
+            self._pages.move_to_end(user_id)
+            while len(self._pages) > self.max_users:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._pages.pop(user_id, None)
+
+reminder_list_cache = ReminderListCache(REMINDER_LIST_CACHE_TTL, REMINDER_LIST_CACHE_MAX_USERS)
@@ -0,0 +1,97 @@
+import random
+import re
+import zlib
+
+# Local stand-in for the notification LLM call. Follows the same style rules as
+# get_reminder_notification_prompt: "⏰ Reminder:" + capitalized content, a short
+# follow-up line and 1-2 emojis picked from the reminder content.
+
+# (keywords, emojis, follow-ups); the first category with a keyword in the content wins
+_CATEGORIES = [
+    (("meeting", "call with", "standup", "interview", "appointment", "zoom", "sync"), ("📅", "🗓️", "💼"), (
+        "Time to get ready!",
+        "Go make it a great one.",
+        "You've got this!",
+    )),
+    (("dog", "cat", "pet", "feed", "walk the"), ("🐾", "🐶"), (
+        "Someone's counting on you!",
+        "A happy pet is a happy home.",
+    )),
+    (("water", "drink", "hydrate"), ("💧", "🥤"), (
+        "Stay hydrated!",
+        "Your body will thank you.",
+        "A quick sip goes a long way.",
+    )),
+    (("pill", "pills", "medicine", "medication", "meds", "vitamin", "vitamins", "dose"), ("💊", "🩺"), (
+        "Take care of yourself!",
+        "Health comes first.",
+        "Don't skip it!",
+    )),
+    (("call", "phone", "ring", "text", "message", "email", "reply"), ("📞", "📱", "✉️"), (
+        "Now's a good time to reach out.",
+        "They'll be glad to hear from you.",
+        "Quick and easy, you've got this.",
+    )),
+    (("gym", "workout", "run", "walk", "exercise", "yoga", "stretch", "training"), ("🏃", "💪", "🧘"), (
+        "Let's get moving!",
+        "Every bit counts.",
+        "You'll feel great afterwards.",
+    )),
+    (("eat", "lunch", "dinner", "breakfast", "cook", "food", "snack", "meal"), ("🍽️", "🥗", "🍳"), (
+        "Enjoy your meal!",
+        "Time to refuel.",
+        "Bon appétit!",
+    )),
+    (("buy", "shop", "shopping", "groceries", "grocery", "order", "pick up", "store"), ("🛒", "🛍️"), (
+        "Don't forget the list!",
+        "Happy shopping!",
+        "Quick errand, big relief.",
+    )),
+    (("pay", "bill", "bills", "rent", "invoice", "bank", "taxes"), ("💳", "💰"), (
+        "Stay on top of it!",
+        "Future you will be grateful.",
+        "One less thing to worry about.",
+    )),
+    (("study", "homework", "read", "assignment", "exam", "class", "lesson", "practice"), ("📚", "✏️"), (
+        "Focus mode on!",
+        "Small steps add up.",
+        "You're doing great.",
+    )),
+    (("sleep", "bed", "nap", "rest"), ("😴", "🌙"), (
+        "Time to wind down.",
+        "Rest up!",
+        "Sweet dreams!",
+    )),
+    (("birthday", "anniversary", "party", "celebrate"), ("🎉", "🎂"), (
+        "Time to celebrate!",
+        "Make it special!",
+        "Don't forget to say it!",
+    )),
+    (("clean", "laundry", "dishes", "trash", "vacuum", "chores"), ("🧹", "🧺"), (
+        "A tidy space, a clear mind.",
+        "Knock it out quickly!",
+        "It'll be done before you know it.",
+    )),
+]
+_DEFAULT = (("✨", "📌", "👍"), (
+    "You've got this!",
+    "Time to get it done.",
+    "Don't let it slip!",
+    "One more thing checked off soon.",
+))
+
+def _category(content_lower):
+    for keywords, emojis, follow_ups in _CATEGORIES:
+        for keyword in keywords:
+            if re.search(rf"\b{re.escape(keyword)}\b", content_lower):
+                return emojis, follow_ups
+    return _DEFAULT
+
+def render_template_notification(content, reminder_id=None):
+    """Build a reminder notification from the local phrase bank (no LLM call)"""
+    text = re.sub(r"\s+", " ", content or "").strip().rstrip(".!")
+    text = text[:1].upper() + text[1:].lower() if text else "Your reminder"
+    emojis, follow_ups = _category(text.lower())
+    # Seed by reminder so the same reminder always reads the same, but different ones vary
+    rng = random.Random(reminder_id if reminder_id is not None else zlib.crc32(text.encode()))
+    return f"⏰ Reminder: {text}! {rng.choice(follow_ups)} {rng.choice(emojis)}"
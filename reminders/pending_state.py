@@ -0,0 +1,108 @@
+import heapq
+import logging
+import threading
+import time
+
+from config import AWAITING_LOCATION_TTL, AWAITING_LOCATION_MAX_USERS, AWAITING_LOCATION_BACKEND
+from .db import save_pending_location, get_pending_location, delete_pending_location, purge_expired_pending_locations
+
+class ExpiringStore:
+    """Bounded key -> value map whose entries expire after a fixed TTL.
+
+    Expiry times are monotonic and kept in a min-heap, so every operation first
+    drops whatever has expired without scanning the whole map. When full, the
+    entry closest to expiry is evicted to make room.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max(1, int(max_size))
+        self._values = {}    # key -> (value, expires_at)
+        self._expiry = []    # (expires_at, key); stale slots are skipped
+        self._lock = threading.Lock()
+
+    def _sweep(self, now):
+        # Caller holds the lock
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._values.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._values[key]
+        # Re-setting a key leaves an old heap slot behind; compact if they pile up
+        if len(self._expiry) > 64 and len(self._expiry) > 2 * len(self._values):
+            self._expiry = [(expires_at, key) for key, (_, expires_at) in self._values.items()]
+            heapq.heapify(self._expiry)
+
+    def set(self, key, value):
+        now = time.monotonic()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._sweep(now)
+            if key not in self._values and len(self._values) >= self.max_size:
+                # Evict whichever live entry would expire soonest
+                while self._expiry:
+                    old_expires_at, old_key = heapq.heappop(self._expiry)
+                    entry = self._values.get(old_key)
+                    if entry is not None and entry[1] == old_expires_at:
+                        del self._values[old_key]
+                        logging.info(f"🌎 Awaiting-location store full, dropped pending request for {old_key}")
+                        break
+            self._values[key] = (value, expires_at)
+            heapq.heappush(self._expiry, (expires_at, key))
+
+    def get(self, key):
+        with self._lock:
+            self._sweep(time.monotonic())
+            entry = self._values.get(key)
+            return entry[0] if entry is not None else None
+
+    def pop(self, key):
+        with self._lock:
+            self._sweep(time.monotonic())
+            entry = self._values.pop(key, None)
+            return entry[0] if entry is not None else None
+
+    def __len__(self):
+        with self._lock:
+            self._sweep(time.monotonic())
+            return len(self._values)
+
+class AwaitingLocationStore:
+    """Reminder data parked while we wait for the user to say where they are.
+
+    The 'memory' backend keeps it in-process; the 'db' backend keeps it in the
+    pending_locations table so it survives restarts and is visible to every
+    bot process.
+    """
+
+    def __init__(self, ttl=AWAITING_LOCATION_TTL, max_size=AWAITING_LOCATION_MAX_USERS, backend=AWAITING_LOCATION_BACKEND):
+        self.ttl = ttl
+        self.backend = backend
+        self._memory = ExpiringStore(ttl, max_size)
+        self._last_purge = 0.0
+
+    async def get(self, user_id):
+        """Return the pending reminder data, or None if there is none or it has expired"""
+        if self.backend == 'db':
+            return await get_pending_location(user_id)
+        return self._memory.get(user_id)
+
+    async def set(self, user_id, reminder_data):
+        if self.backend == 'db':
+            await save_pending_location(user_id, reminder_data, self.ttl)
+            # Expired rows are already invisible to get(); delete them now and then
+            if time.monotonic() - self._last_purge >= 60:
+                self._last_purge = time.monotonic()
+                await purge_expired_pending_locations()
+            return
+        self._memory.set(user_id, reminder_data)
+
+    async def pop(self, user_id):
+        """Remove and return the pending reminder data (None if expired)"""
+        if self.backend == 'db':
+            reminder_data = await get_pending_location(user_id)
+            # Only the process whose delete lands gets to act on the reply
+            if reminder_data is None or not await delete_pending_location(user_id):
+                return None
+            return reminder_data
+        return self._memory.pop(user_id)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import json
 import openai
@@ -16,7 +17,7 @@ current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
-from config import MODEL
+from config import MODEL, INTENT_CLASSIFIER_THRESHOLD, CANCEL_CANDIDATE_LIMIT
 from config import (
     get_reminder_detection_prompt,
     get_reminder_extraction_prompt,
@@ -30,35 +31,22 @@ from .db import (
     get_user_timezone,
     update_user_timezone,
     get_user_reminders,
+    get_user_reminders_page,
     get_reminder_by_content,
     get_last_created_reminder,
     cancel_reminder,
-    get_any_reminder_timezone
+    cancel_reminders
 )
+from .intent_classifier import classify_reminder_operation, record_classification
+from .time_parser import extract_reminder_details_locally
+from .gazetteer import timezone_gazetteer
+from .cancel_ranker import resolve_cancellation_locally, rank_cancellation_candidates, search_terms
+from .list_cache import reminder_list_cache
 
 # Conversation state tracking
-# Conversation state tracking
-from collections import defaultdict
-from datetime import datetime, timedelta
-
-class TimeoutDict(defaultdict):
-    def __init__(self):
-        super().__init__(dict)
-        self.timeouts = {}
-    
-    def __getitem__(self, key):
-        if key in self.timeouts:
-            if datetime.now() - self.timeouts[key] > timedelta(seconds=20):
-                del self[key]
-                del self.timeouts[key]
-                return None
-        return super().__getitem__(key)
-    
-    def __setitem__(self, key, value):
-        super().__setitem__(key, value)
-        self.timeouts[key] = datetime.now()
+from .pending_state import AwaitingLocationStore
 
-AWAITING_LOCATION = TimeoutDict()  # user_id -> reminder_data with 10s timeout
+AWAITING_LOCATION = AwaitingLocationStore()  # user_id -> reminder_data, expires after AWAITING_LOCATION_TTL
 
 # Add a global messaging function for Discord patching
 reminders_send_message = lambda recipient, content, **kwargs: (_ for _ in ()).throw(NotImplementedError('reminders_send_message must be patched by the Discord bot.'))
@@ -111,7 +99,7 @@ class CancelReminderButton(Button):
             logging.info(f"⚠️ Button clicked: Attempting to cancel reminder {reminder_id} for user {user_id}")
             
             # Cancel the reminder when clicked
-            success = cancel_reminder(reminder_id, user_id)
+            success = await cancel_reminder(reminder_id, user_id)
             
             if success:
                 logging.info(f"✅ Successfully cancelled reminder {reminder_id} via button")
@@ -124,6 +112,53 @@ class CancelReminderButton(Button):
             logging.error(f"⚠️ Button custom_id: {self.custom_id}")
             await interaction.response.send_message("❌ An error occurred while cancelling the reminder.", ephemeral=True)
 
+# Previous/next buttons under a paginated reminder list
+class ReminderPageButton(Button):
+    def __init__(self, label, step):
+        super().__init__(style=discord.ButtonStyle.secondary, label=label)
+        self.step = step
+
+    async def callback(self, interaction):
+        await self.view.turn_page(interaction, self.step)
+
+class ReminderListView(View):
+    """Pages through a user's reminders using the keyset cursors seen so far"""
+
+    def __init__(self, user_id, next_cursor):
+        super().__init__(timeout=600)
+        self.user_id = user_id
+        self.cursors = [None, next_cursor]  # cursors[i] starts page i + 1
+        self.page = 0
+        self.prev_button = ReminderPageButton("◀ Previous", -1)
+        self.next_button = ReminderPageButton("Next ▶", 1)
+        self.add_item(self.prev_button)
+        self.add_item(self.next_button)
+        self._refresh_buttons()
+
+    def _refresh_buttons(self):
+        self.prev_button.disabled = self.page == 0
+        self.next_button.disabled = self.cursors[self.page + 1] is None
+
+    async def turn_page(self, interaction, step):
+        try:
+            if str(interaction.user.id) != self.user_id:
+                await interaction.response.send_message("❌ These aren't your reminders.", ephemeral=True)
+                return
+            page = self.page + step
+            if page < 0 or (page > 0 and self.cursors[page] is None):
+                await interaction.response.defer()
+                return
+            text, next_cursor = await get_reminder_list_page(self.user_id, self.cursors[page], page + 1)
+            self.page = page
+            # The list may have changed since the last click; forget cursors past this page
+            del self.cursors[page + 1:]
+            self.cursors.append(next_cursor)
+            self._refresh_buttons()
+            await interaction.response.edit_message(content=text, view=self)
+        except Exception as e:
+            logging.error(f"❌ Error turning reminder list page: {e}")
+            await interaction.response.send_message("❌ An error occurred while loading your reminders.", ephemeral=True)
+
 def detect_reminder_request(text, user_id=None):
     """Determine if a message is requesting to set a reminder"""
     try:
@@ -154,6 +189,14 @@ def detect_reminder_request(text, user_id=None):
 def extract_reminder_details(text, user_id=None):
     """Extract reminder content, time and timezone from text"""
     try:
+        # Common phrasings are parsed locally; only unusual ones need the long extraction prompt
+        try:
+            reminder_data = extract_reminder_details_locally(text)
+            if reminder_data:
+                return reminder_data
+        except Exception as e:
+            logging.error(f"❌ Error in local reminder parsing, falling back to LLM: {e}")
+        
         # API call to extract reminder details
         response = openai.chat.completions.create(
             model=MODEL,
@@ -193,6 +236,10 @@ def extract_reminder_details(text, user_id=None):
 
 def extract_timezone_from_location(location_text, user_id=None):
     """Convert a location description to a timezone string"""
+    # Known places and earlier LLM answers resolve offline
+    timezone = timezone_gazetteer.lookup(location_text)
+    if timezone:
+        return timezone
     try:
         # API call to extract timezone
         response = openai.chat.completions.create(
@@ -220,7 +267,8 @@ def extract_timezone_from_location(location_text, user_id=None):
         # Validate timezone format
         if not timezone or timezone.lower() == "unknown":
             return None
-            
+        
+        timezone_gazetteer.remember(location_text, timezone)
         return timezone
     except Exception as e:
         logging.error(f"❌ Error extracting timezone: {e}")
@@ -499,10 +547,10 @@ def generate_confirmation_message(reminder_data, user_id=None):
         # Fallback message in case of error
         return f"Got it! I'll remind you to {reminder_data.get('content', '')} at {reminder_data.get('time', '')} ✅"
 
-def process_reminder_request(text, user_id):
+async def process_reminder_request(text, user_id):
     """Process a reminder request and respond to the user"""
     # Extract reminder details
-    reminder_data = extract_reminder_details(text, user_id)
+    reminder_data = await asyncio.to_thread(extract_reminder_details, text, user_id)
     
     # Extract recipient and service from user_id
     recipient = user_id.split(';-;')[-1] if ';-;' in user_id else user_id
@@ -528,27 +576,19 @@ def process_reminder_request(text, user_id):
     else:
         # For absolute times, we need a proper timezone
         if not reminder_data.get('timezone'):
-            # Check if we have a timezone from previous reminders
-            timezone = get_user_timezone(user_id)
+            # Check if we have a timezone in the user's settings
+            timezone = await get_user_timezone(user_id)
             
             if timezone and timezone != 'UTC':
                 # Use existing timezone
                 reminder_data['timezone'] = timezone
-                logging.info(f"⏰ Using existing timezone {timezone} from previous reminders")
+                logging.info(f"⏰ Using existing timezone {timezone} from user settings")
             else:
-                # Check for timezone in any existing reminders (including cancelled ones)
-                timezone = get_any_reminder_timezone(user_id)
-                
-                if timezone and timezone != 'UTC':
-                    # Use timezone from existing reminder
-                    reminder_data['timezone'] = timezone
-                    logging.info(f"⏰ Using timezone {timezone} from existing reminder")
-                else:
-                    # Ask for location
-                    reminders_send_message(recipient, "To set your reminder perfectly, I just need to know where in the world you are! 🌎📍 Mind sharing your location? 😄", user_id=user_id, service=service_type)
-                    # Store reminder data while waiting for location
-                    AWAITING_LOCATION[user_id] = reminder_data
-                    return True
+                # Ask for location
+                reminders_send_message(recipient, "To set your reminder perfectly, I just need to know where in the world you are! 🌎📍 Mind sharing your location? 😄", user_id=user_id, service=service_type)
+                # Store reminder data while waiting for location
+                await AWAITING_LOCATION.set(user_id, reminder_data)
+                return True
     
     # Process the time
     scheduled_time = process_reminder_time(
@@ -561,7 +601,7 @@ def process_reminder_request(text, user_id):
         return True
     
     # Save the reminder with the timezone
-    reminder_id = save_reminder(
+    reminder_id = await save_reminder(
         user_id=user_id,
         content=reminder_data['content'],
         scheduled_time=scheduled_time,
@@ -588,7 +628,7 @@ def process_reminder_request(text, user_id):
     
     return True
 
-def process_location_response(text, user_id):
+async def process_location_response(text, user_id):
     """Process a location response and complete reminder creation"""
     try:
         # Extract recipient and service from user_id
@@ -597,36 +637,28 @@ def process_location_response(text, user_id):
         service_type = "SMS" if service and service.lower() == "sms" else "iMessage"
         
         # Get the pending reminder data
-        reminder_data = AWAITING_LOCATION[user_id]
+        reminder_data = await AWAITING_LOCATION.pop(user_id)
         if reminder_data is None:
             # Request has timed out
             logging.info(f"⏰ Location request for {user_id} has timed out")
             reminders_send_message(recipient, "Looks like we moved on from that location request—no worries! 😄👍🌎", user_id=user_id, service=service_type)
             return True
-        del AWAITING_LOCATION[user_id]
         
         # Get timezone from location
-        timezone = extract_timezone_from_location(text, user_id)
+        timezone = await asyncio.to_thread(extract_timezone_from_location, text, user_id)
         
         if not timezone:
             reminders_send_message(recipient, "Oops! 🌎🤷‍♂️ I couldn't pinpoint that location. Can you share a major city or your timezone instead? That'll help me set your reminder just right! 📍😊", user_id=user_id, service=service_type)
             # Put the reminder data back in the waiting list
-            AWAITING_LOCATION[user_id] = reminder_data
+            await AWAITING_LOCATION.set(user_id, reminder_data)
             return True
         
+        # Remember the timezone for future reminders and time queries
+        timezone_saved = await update_user_timezone(user_id, timezone)
+        
         # Check if this was from a time query
         if reminder_data.get('is_time_query'):
-            # Create a cancelled reminder to store the timezone
-            scheduled_time = datetime.now(pytz.UTC)  # Use current time as placeholder
-            reminder_id = save_reminder(
-                user_id=user_id,
-                content='timezone setup',
-                scheduled_time=scheduled_time,
-                timezone=timezone,
-                status='cancelled'  # Set status as cancelled
-            )
-            
-            if not reminder_id:
+            if not timezone_saved:
                 reminders_send_message(recipient, "I had trouble saving your timezone. Please try asking for the time again.", user_id=user_id, service=service_type)
                 return True
             
@@ -652,7 +684,7 @@ def process_location_response(text, user_id):
             return True
         
         # Save to database
-        reminder_id = save_reminder(
+        reminder_id = await save_reminder(
             user_id=user_id,
             content=reminder_data['content'],
             scheduled_time=scheduled_time,
@@ -680,11 +712,10 @@ def process_location_response(text, user_id):
         logging.error(f"❌ Error processing location: {e}")
         reminders_send_message(recipient, "Sorry, I had trouble setting your reminder with that location.", user_id=user_id, service=service_type)
         # Clear the pending request
-        if user_id in AWAITING_LOCATION:
-            del AWAITING_LOCATION[user_id]
+        await AWAITING_LOCATION.pop(user_id)
         return True
 
-def process_location_update(text, user_id):
+async def process_location_update(text, user_id):
     """Process a request to update user's location/timezone"""
     try:
         # Extract recipient and service from user_id
@@ -693,16 +724,19 @@ def process_location_update(text, user_id):
         service_type = "SMS" if service and service.lower() == "sms" else "iMessage"
         
         # Extract timezone from location
-        timezone = extract_timezone_from_location(text, user_id)
+        timezone = await asyncio.to_thread(extract_timezone_from_location, text, user_id)
         
         if not timezone:
             reminders_send_message(recipient, "Sorry, I couldn't recognize that location. Could you provide a major city or timezone?", user_id=user_id, service=service_type)
             return True
         
-        # Update timezone for pending reminders
-        updated = update_user_timezone(user_id, timezone)
+        # Store the new timezone (a single user_settings row)
+        previous_timezone = await get_user_timezone(user_id)
+        if not await update_user_timezone(user_id, timezone):
+            reminders_send_message(recipient, "Sorry, I had trouble updating your location. Please try again.", user_id=user_id, service=service_type)
+            return True
         
-        if updated:
+        if previous_timezone:
             reminders_send_message(recipient, f"✅ I've updated your location. I'll now use {timezone} timezone.", user_id=user_id, service=service_type)
         else:
             reminders_send_message(recipient, f"✅ I've noted your location ({timezone}). I'll use this for your future reminders.", user_id=user_id, service=service_type)
@@ -713,16 +747,19 @@ def process_location_update(text, user_id):
         reminders_send_message(recipient, "Sorry, I had trouble updating your location. Please try again.", user_id=user_id, service=service_type)
         return True
 
-def detect_reminder_operation(text: str, user_id=None) -> str:
-    """Determine what type of reminder operation is being requested"""
+def detect_reminder_operation_locally(text: str):
+    """Return the reminder operation if the local classifier is confident, otherwise None"""
+    operation, confidence = classify_reminder_operation(text)
+    if confidence >= INTENT_CLASSIFIER_THRESHOLD:
+        record_classification('local')
+        logging.info(f"⏰ Local reminder operation detection: '{operation}' ({confidence:.2f}) for message: {text[:50]}...")
+        return operation
+    return None
+
+def detect_reminder_operation_llm(text: str, user_id=None) -> str:
+    """Ask the LLM which reminder operation is being requested"""
     try:
-        # First check for time queries using simpler pattern matching
-        from .time_handler import _parse_time_query
-        time_type, _ = _parse_time_query(text)
-        if time_type != 'unknown':
-            return 'time'
-        
-        # If not a time query, proceed with normal reminder operation detection
+        record_classification('llm')
         response = openai.chat.completions.create(
             model=MODEL,
             messages=[
@@ -750,6 +787,18 @@ def detect_reminder_operation(text: str, user_id=None) -> str:
         logging.error(f"❌ Error in reminder operation detection: {e}")
         return "none"
 
+def detect_reminder_operation(text: str, user_id=None) -> str:
+    """Determine what type of reminder operation is being requested"""
+    try:
+        # First try the local classifier (time queries, clear create/list/cancel/none cases)
+        operation = detect_reminder_operation_locally(text)
+        if operation is not None:
+            return operation
+    except Exception as e:
+        logging.error(f"❌ Error in local reminder operation detection: {e}")
+    # Ambiguous message, fall back to LLM detection
+    return detect_reminder_operation_llm(text, user_id)
+
 def format_reminder_list(reminders: list, user_timezone: str) -> str:
     """Format a list of reminders in a user-friendly way"""
     if not reminders:
@@ -879,16 +928,35 @@ def format_reminder_list(reminders: list, user_timezone: str) -> str:
     
     return message.strip()
 
-def process_list_request(user_id: str) -> str:
-    """Process a request to list reminders"""
+async def get_reminder_list_page(user_id: str, cursor=None, page_number: int = 1) -> tuple:
+    """Formatted page of a user's pending reminders starting at cursor, and the next page's cursor"""
+    cached = reminder_list_cache.get(user_id, cursor)
+    if cached is not None:
+        return cached
+
     # Get the user's timezone
-    timezone = get_user_timezone(user_id) or "UTC"
-    
-    # Get pending reminders
-    reminders = get_user_reminders(user_id, status="pending")
-    
+    timezone = await get_user_timezone(user_id) or "UTC"
+
+    # Get one page of pending reminders
+    reminders, next_cursor = await get_user_reminders_page(user_id, after=cursor)
+
     # Format the list
-    return format_reminder_list(reminders, timezone)
+    text = format_reminder_list(reminders, timezone)
+    if next_cursor is not None or page_number > 1:
+        text += f"\n📄 **Page {page_number}**"
+    page = (text, next_cursor)
+    reminder_list_cache.put(user_id, cursor, page)
+    return page
+
+async def process_list_request(user_id: str) -> tuple:
+    """Process a request to list reminders.
+
+    Returns:
+        tuple: (message, view); view holds the next/prev buttons, or is None when everything fits on one page
+    """
+    text, next_cursor = await get_reminder_list_page(user_id)
+    view = ReminderListView(user_id, next_cursor) if next_cursor is not None else None
+    return text, view
 
 def modify_reminder_list_for_display(reminders, user_timezone):
     """Convert reminder list to user-friendly format that includes time information"""
@@ -927,199 +995,209 @@ def modify_reminder_list_for_display(reminders, user_timezone):
     
     return enhanced_reminders
 
-def process_cancel_request(text: str, user_id: str) -> str:
+async def _extract_cancellation_with_llm(text, user_id, enhanced_reminders):
+    """Ask the LLM which reminders to cancel, showing it only the best local candidates"""
+    # Only the top candidates go in the prompt; the model's indices refer to this shortlist
+    candidate_indices = rank_cancellation_candidates(text, enhanced_reminders, CANCEL_CANDIDATE_LIMIT)
+    enhanced_reminder_list = [enhanced_reminders[i]['enhanced_content'] for i in candidate_indices]
+    
+    # Create the prompt with enhanced reminders
+    system_prompt = get_reminder_cancellation_extraction_prompt(datetime.now().strftime('%Y-%m-%d'))
+    user_prompt = f"""Current reminders: {enhanced_reminder_list}
+    
+    Request: {text}"""
+    
+    # Use AI to extract cancellation details
+    response = await asyncio.to_thread(
+        openai.chat.completions.create,
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.1,
+        max_tokens=100
+    )
+    
+    # Track token usage if available
+    if hasattr(response, 'usage'):
+        reminders_log_token_usage(
+            user_id,
+            MODEL,
+            getattr(response.usage, 'prompt_tokens', 0),
+            getattr(response.usage, 'completion_tokens', 0),
+            getattr(response.usage, 'prompt_tokens', 0) + getattr(response.usage, 'completion_tokens', 0)
+        )
+    
+    # Parse the response
+    result = response.choices[0].message.content.strip()
+    json_start = result.find('{')
+    json_end = result.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        return None
+    cancel_data = json.loads(result[json_start:json_end])
+    
+    # Map shortlist positions back to positions in enhanced_reminders
+    cancel_data["matches"] = [
+        candidate_indices[index] for index in cancel_data.get("matches") or []
+        if isinstance(index, int) and 0 <= index < len(candidate_indices)
+    ]
+    return cancel_data
+
+async def process_cancel_request(text: str, user_id: str) -> str:
     """Process a request to cancel a reminder"""
     try:
-        # Get all pending reminders first
-        all_reminders = get_user_reminders(user_id, status="pending")
-        if not all_reminders:
-            return "You don't have any active reminders to cancel."
+        # A request naming reminder content is looked up through the FULLTEXT index (best
+        # matches first) instead of loading and formatting every pending reminder; fixed
+        # phrases ("cancel all", "cancel that") and searches without hits use the full list
+        all_reminders = None
+        considered = []
+        terms = search_terms(text)
+        if terms and resolve_cancellation_locally(text, []) is None:
+            considered = await get_reminder_by_content(user_id, terms, CANCEL_CANDIDATE_LIMIT)
+        if not considered:
+            all_reminders = await get_user_reminders(user_id, status="pending")
+            if not all_reminders:
+                return "You don't have any active reminders to cancel."
+            considered = all_reminders
             
         # Get user's timezone
-        timezone = get_user_timezone(user_id) or "UTC"
+        timezone = await get_user_timezone(user_id) or "UTC"
         user_tz = pytz.timezone(timezone)
         now = datetime.now(user_tz)
         today = now.date()
         tomorrow = today + timedelta(days=1)
         
         # Enhanced reminders with date/time info for better matching
-        enhanced_reminders = modify_reminder_list_for_display(all_reminders, timezone)
-        
-        # Create two lists: one for display to the model with enhanced content (includes date/time)
-        # and one that preserves the original reminder data
-        enhanced_reminder_list = [r['enhanced_content'] for r in enhanced_reminders]
-        
-        # Create the prompt with enhanced reminders
-        system_prompt = get_reminder_cancellation_extraction_prompt(datetime.now().strftime('%Y-%m-%d'))
-        user_prompt = f"""Current reminders: {enhanced_reminder_list}
+        enhanced_reminders = modify_reminder_list_for_display(considered, timezone)
         
-        Request: {text}"""
-        
-        # Use AI to extract cancellation details
-        response = openai.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.1,
-            max_tokens=100
-        )
-        
-        # Track token usage if available
-        if hasattr(response, 'usage'):
-            reminders_log_token_usage(
-                user_id,
-                MODEL,
-                getattr(response.usage, 'prompt_tokens', 0),
-                getattr(response.usage, 'completion_tokens', 0),
-                getattr(response.usage, 'prompt_tokens', 0) + getattr(response.usage, 'completion_tokens', 0)
-            )
-        
-        # Parse the response
-        result = response.choices[0].message.content.strip()
-        json_start = result.find('{')
-        json_end = result.rfind('}') + 1
+        # Clear-cut requests (exact content/time, "cancel that", "cancel all") skip the LLM
+        cancel_data = resolve_cancellation_locally(text, enhanced_reminders)
+        if cancel_data is not None:
+            logging.info(f"⏰ Resolved cancellation locally: {cancel_data}")
+        else:
+            cancel_data = await _extract_cancellation_with_llm(text, user_id, enhanced_reminders)
+        if cancel_data is None:
+            return "I couldn't understand which reminder to cancel. Could you be more specific?"
+        if cancel_data["type"] in ("timeperiod", "all") and all_reminders is None:
+            # Date and "all" cancellations cover every pending reminder, not just the search hits
+            all_reminders = await get_user_reminders(user_id, status="pending")
         
-        if json_start >= 0 and json_end > json_start:
-            json_str = result[json_start:json_end]
-            cancel_data = json.loads(json_str)
+        # Handle different cancellation types
+        if cancel_data["type"] == "recent":
+            # Cancel most recent reminder
+            last_reminder = await get_last_created_reminder(user_id)
+            if last_reminder and last_reminder['status'] == 'pending':
+                if await cancel_reminder(last_reminder['id'], user_id):
+                    # Capitalize the first letter of each word in the reminder content
+                    content = ' '.join(word.capitalize() for word in last_reminder['content'].split())
+                    return f"✅ Cancelled your reminder: {content}"
+            return "I couldn't find your most recent reminder. Please say \"cancel my reminder about [content]\" to cancel a specific reminder."
             
-            # Handle different cancellation types
-            if cancel_data["type"] == "recent":
-                # Cancel most recent reminder
-                last_reminder = get_last_created_reminder(user_id)
-                if last_reminder and last_reminder['status'] == 'pending':
-                    if cancel_reminder(last_reminder['id'], user_id):
-                        # Capitalize the first letter of each word in the reminder content
-                        content = ' '.join(word.capitalize() for word in last_reminder['content'].split())
-                        return f"✅ Cancelled your reminder: {content}"
-                return "I couldn't find your most recent reminder. Please say \"cancel my reminder about [content]\" to cancel a specific reminder."
+        elif cancel_data["type"] == "timeperiod":
+            # Convert reminders to user's timezone and group them
+            reminders_by_date = {}
+            for i, reminder in enumerate(all_reminders):
+                reminder_time = reminder['scheduled_time'].replace(tzinfo=pytz.UTC)
+                local_time = reminder_time.astimezone(user_tz)
+                reminder_date = local_time.date()
+                if reminder_date not in reminders_by_date:
+                    reminders_by_date[reminder_date] = []
+                # Store both the reminder and its index
+                reminders_by_date[reminder_date].append((i, reminder))
+            
+            target_date = None
+            if cancel_data["timeperiod"] == "today":
+                target_date = today
+            elif cancel_data["timeperiod"] == "tomorrow":
+                target_date = tomorrow
+            elif cancel_data["timeperiod"] == "all":
+                # Cancel all reminders
+                cancelled = await cancel_reminders(user_id, [reminder['id'] for reminder in all_reminders], user_id)
+                cancelled_count = len(cancelled)
                 
-            elif cancel_data["type"] == "timeperiod":
-                # Convert reminders to user's timezone and group them
-                reminders_by_date = {}
-                for i, reminder in enumerate(all_reminders):
-                    reminder_time = reminder['scheduled_time'].replace(tzinfo=pytz.UTC)
-                    local_time = reminder_time.astimezone(user_tz)
-                    reminder_date = local_time.date()
-                    if reminder_date not in reminders_by_date:
-                        reminders_by_date[reminder_date] = []
-                    # Store both the reminder and its index
-                    reminders_by_date[reminder_date].append((i, reminder))
+                if cancelled_count > 0:
+                    return f"✅ Cancelled all {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
+                else:
+                    return "Sorry, I had trouble cancelling the reminders. Please try again."
+            
+            # Check if the timeperiod cancellation also has specific matches (for date-specific cancellations)
+            if cancel_data.get("matches") and len(cancel_data["matches"]) > 0:
+                # We have specific matches, treat it like a content cancellation
+                match_ids = [enhanced_reminders[index]['original']['id'] for index in cancel_data["matches"] if 0 <= index < len(enhanced_reminders)]
+                cancelled = await cancel_reminders(user_id, match_ids, user_id)
+                cancelled_count = len(cancelled)
+                cancelled_content = cancelled[0]['content'] if cancelled else None
                 
-                target_date = None
-                if cancel_data["timeperiod"] == "today":
-                    target_date = today
-                elif cancel_data["timeperiod"] == "tomorrow":
-                    target_date = tomorrow
-                elif cancel_data["timeperiod"] == "all":
-                    # Cancel all reminders
-                    cancelled_count = 0
-                    for reminder in all_reminders:
-                        if cancel_reminder(reminder['id'], user_id):
-                            cancelled_count += 1
-                    
-                    if cancelled_count > 0:
-                        return f"✅ Cancelled all {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
-                    else:
-                        return "Sorry, I had trouble cancelling the reminders. Please try again."
+                if cancelled_count == 1 and cancelled_content:
+                    # If we cancelled exactly one reminder, show its content
+                    content = ' '.join(word.capitalize() for word in cancelled_content.split())
+                    return f"✅ Cancelled your reminder: {content}"
+                elif cancelled_count > 0:
+                    # If we cancelled multiple reminders, just show the count
+                    return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
+                else:
+                    return "Sorry, I had trouble cancelling the reminder. Please try again."
+            
+            # Regular timeperiod handling (today/tomorrow)
+            if target_date:
+                if target_date not in reminders_by_date:
+                    return f"You don't have any reminders scheduled for {'today' if target_date == today else 'tomorrow'}."
                 
-                # Check if the timeperiod cancellation also has specific matches (for date-specific cancellations)
-                if cancel_data.get("matches") and len(cancel_data["matches"]) > 0:
-                    # We have specific matches, treat it like a content cancellation
-                    cancelled_count = 0
-                    cancelled_content = None
-                    
-                    for index in cancel_data["matches"]:
-                        if 0 <= index < len(enhanced_reminders):
-                            # Get the original reminder from our enhanced list
-                            original_reminder = enhanced_reminders[index]['original']
-                            if cancel_reminder(original_reminder['id'], user_id):
-                                cancelled_count += 1
-                                # Save the content of the first cancelled reminder
-                                if not cancelled_content:
-                                    cancelled_content = original_reminder['content']
-                    
-                    if cancelled_count == 1 and cancelled_content:
-                        # If we cancelled exactly one reminder, show its content
-                        content = ' '.join(word.capitalize() for word in cancelled_content.split())
+                # If there's only one reminder on the target date, cancel it directly
+                if len(reminders_by_date[target_date]) == 1:
+                    idx, reminder = reminders_by_date[target_date][0]
+                    if await cancel_reminder(reminder['id'], user_id):
+                        content = ' '.join(word.capitalize() for word in reminder['content'].split())
                         return f"✅ Cancelled your reminder: {content}"
-                    elif cancelled_count > 0:
-                        # If we cancelled multiple reminders, just show the count
-                        return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
-                    else:
-                        return "Sorry, I had trouble cancelling the reminder. Please try again."
                 
-                # Regular timeperiod handling (today/tomorrow)
-                if target_date:
-                    if target_date not in reminders_by_date:
-                        return f"You don't have any reminders scheduled for {'today' if target_date == today else 'tomorrow'}."
-                    
-                    # If there's only one reminder on the target date, cancel it directly
-                    if len(reminders_by_date[target_date]) == 1:
-                        idx, reminder = reminders_by_date[target_date][0]
-                        if cancel_reminder(reminder['id'], user_id):
-                            content = ' '.join(word.capitalize() for word in reminder['content'].split())
-                            return f"✅ Cancelled your reminder: {content}"
-                    
-                    # Otherwise cancel all reminders for the target date
-                    cancelled_count = 0
-                    for _, reminder in reminders_by_date[target_date]:
-                        if cancel_reminder(reminder['id'], user_id):
-                            cancelled_count += 1
-                    
-                    if cancelled_count > 0:
-                        return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''} scheduled for {'today' if target_date == today else 'tomorrow'}."
-                    else:
-                        return "Sorry, I had trouble cancelling the reminders. Please try again."
-                        
-            elif cancel_data["type"] == "all":
-                # Cancel all reminders
-                cancelled_count = 0
-                for reminder in all_reminders:
-                    if cancel_reminder(reminder['id'], user_id):
-                        cancelled_count += 1
+                # Otherwise cancel all reminders for the target date
+                cancelled = await cancel_reminders(user_id, [reminder['id'] for _, reminder in reminders_by_date[target_date]], user_id)
+                cancelled_count = len(cancelled)
                 
                 if cancelled_count > 0:
-                    return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
+                    return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''} scheduled for {'today' if target_date == today else 'tomorrow'}."
                 else:
                     return "Sorry, I had trouble cancelling the reminders. Please try again."
                     
-            elif cancel_data["type"] == "content":
-                # Cancel reminders matching the content
-                if not cancel_data.get("matches"):
-                    return "I couldn't find any reminders matching that description. Please say \"cancel my reminder about [content]\" to cancel a specific reminder."
-                
-                # If there's exactly one match, cancel it and return its original content
-                if len(cancel_data["matches"]) == 1:
-                    index = cancel_data["matches"][0]
-                    if 0 <= index < len(enhanced_reminders):
-                        original_reminder = enhanced_reminders[index]['original']
-                        original_content = enhanced_reminders[index]['content']  # Get the original content without date/time
-                        
-                        if cancel_reminder(original_reminder['id'], user_id):
-                            # Use the original reminder content, not the query text
-                            content = ' '.join(word.capitalize() for word in original_content.split())
-                            return f"✅ Cancelled your reminder: {content}"
-                
-                # If there are multiple matches, cancel them all
-                cancelled_count = 0
-                for index in cancel_data["matches"]:
-                    if 0 <= index < len(enhanced_reminders):
-                        # Get the original reminder from our enhanced list
-                        original_reminder = enhanced_reminders[index]['original']
-                        if cancel_reminder(original_reminder['id'], user_id):
-                            cancelled_count += 1
+        elif cancel_data["type"] == "all":
+            # Cancel all reminders
+            cancelled = await cancel_reminders(user_id, [reminder['id'] for reminder in all_reminders], user_id)
+            cancelled_count = len(cancelled)
+            
+            if cancelled_count > 0:
+                return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
+            else:
+                return "Sorry, I had trouble cancelling the reminders. Please try again."
                 
-                if cancelled_count > 0:
-                    # For multiple reminders, just show the count
-                    return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
-                else:
-                    return "Sorry, I had trouble cancelling the reminder. Please try again."
+        elif cancel_data["type"] == "content":
+            # Cancel reminders matching the content
+            if not cancel_data.get("matches"):
+                return "I couldn't find any reminders matching that description. Please say \"cancel my reminder about [content]\" to cancel a specific reminder."
             
-            return "I couldn't understand which reminder to cancel. Could you be more specific?"
+            # If there's exactly one match, cancel it and return its original content
+            if len(cancel_data["matches"]) == 1:
+                index = cancel_data["matches"][0]
+                if 0 <= index < len(enhanced_reminders):
+                    original_reminder = enhanced_reminders[index]['original']
+                    original_content = enhanced_reminders[index]['content']  # Get the original content without date/time
+                    
+                    if await cancel_reminder(original_reminder['id'], user_id):
+                        # Use the original reminder content, not the query text
+                        content = ' '.join(word.capitalize() for word in original_content.split())
+                        return f"✅ Cancelled your reminder: {content}"
             
+            # If there are multiple matches, cancel them all
+            match_ids = [enhanced_reminders[index]['original']['id'] for index in cancel_data["matches"] if 0 <= index < len(enhanced_reminders)]
+            cancelled = await cancel_reminders(user_id, match_ids, user_id)
+            cancelled_count = len(cancelled)
+            
+            if cancelled_count > 0:
+                # For multiple reminders, just show the count
+                return f"✅ Cancelled {cancelled_count} reminder{'s' if cancelled_count > 1 else ''}."
+            else:
+                return "Sorry, I had trouble cancelling the reminder. Please try again."
+        
         return "I couldn't understand which reminder to cancel. Could you be more specific?"
         
     except Exception as e:
@@ -14,31 +14,52 @@ from threading import Event
 import asyncio
 from bot import MAIN_EVENT_LOOP
 import inspect
+import socket
+import uuid
 
 # Add the parent directory to the path to help with imports
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
-from config import MODEL
-from config import get_reminder_notification_prompt
-from .db import get_due_reminders, mark_reminder_sent
+from config import MODEL, REMINDER_SWEEP_INTERVAL, REMINDER_DUE_BATCH_LIMIT, REMINDER_DELIVERY_CONCURRENCY
+from config import REMINDER_ARCHIVE_INTERVAL, NOTIFICATION_BATCH_SIZE, CATCHUP_DIGEST_MAX_REMINDERS
+from config import NOTIFICATION_LOOKAHEAD_MINUTES, NOTIFICATION_LOOKAHEAD_INTERVAL
+from config import NOTIFICATION_MODE, NOTIFICATION_MODE_BY_GUILD, NOTIFICATION_TEMPLATE_QUEUE_THRESHOLD
+from config import get_reminder_notification_prompt, get_reminder_notification_batch_prompt
+from .db import claim_due_reminders, get_pending_reminders, mark_reminder_sent, release_reminder_lease, archive_reminders
+from .db import get_upcoming_reminders_without_notification, save_reminder_notifications
+from .timer_heap import reminder_heap
+from .delivery import ReminderDeliveryPipeline
+from .notification_templates import render_template_notification
+from .catchup import CatchUpPolicy, render_digest
 
 # Global event for stopping the scheduler
 stop_event = Event()
 
+# Identifies this process's claims on the reminders table (lease_owner is VARCHAR(64))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[-64:]
+
 # Add a global messaging function for Discord patching
 reminders_send_message = lambda recipient, content, **kwargs: (_ for _ in ()).throw(NotImplementedError('reminders_send_message must be patched by the Discord bot.'))
 
 # Add a global token usage logger for Discord patching
 reminders_log_token_usage = lambda user_id, model, prompt_tokens, completion_tokens, purpose=None, chat_guid=None: None
 
+# Add a global guild lookup for Discord patching (user_id -> IDs of guilds the user is in)
+reminders_get_user_guild_ids = lambda user_id: []
+
 import os
 from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
 import reminders.db_pool
 
+async def load_pending_reminders():
+    """Seed the timer heap with every pending reminder from the database"""
+    pending = await get_pending_reminders()
+    reminder_heap.load(pending)
+
 async def run_scheduler_async():
-    logging.info("🔔 Reminder scheduler running with 1 second interval (async)")
+    logging.info("🔔 Reminder scheduler running on in-memory timer heap (async)")
     print(f"[Scheduler] DB_HOST={os.environ.get('DB_HOST', DB_HOST)} DB_USER={os.environ.get('DB_USER', DB_USER)} DB_NAME={os.environ.get('DB_NAME', DB_NAME)}", flush=True)
     # Wait for db_pool to be initialized
     while reminders.db_pool.db_pool is None:
@@ -47,33 +68,70 @@ async def run_scheduler_async():
     import aiomysql
     from reminders.db_pool import create_db_pool
     reconnect_delay = 5  # seconds, can increase with backoff if desired
+    reminder_heap.attach(asyncio.get_running_loop())
+    # Look up the patched module globals at call time rather than binding them here
+    delivery_pipeline = ReminderDeliveryPipeline(
+        generate=lambda content, user_id: generate_notification_message(content, user_id),
+        generate_batch=generate_notification_batch,
+        batch_size=NOTIFICATION_BATCH_SIZE,
+        send=lambda recipient, notification, **kwargs: reminders_send_message(recipient, notification, **kwargs),
+        mark_sent=mark_reminder_sent,
+        concurrency=REMINDER_DELIVERY_CONCURRENCY,
+        release=lambda reminder_id: release_reminder_lease(reminder_id, WORKER_ID),
+        render_local=lambda reminder: render_notification_locally(reminder, delivery_pipeline)
+    )
+    delivery_pipeline.start()
+    catch_up = CatchUpPolicy()
+    heap_loaded = False
+    backlog = False
+    last_sweep = time.monotonic()
+    logging.info(f"🔔 Scheduler worker id: {WORKER_ID}")
     while not stop_event.is_set():
         try:
-            due_reminders = await get_due_reminders()
-            if due_reminders:
-                for reminder in due_reminders:
-                    try:
-                        reminder_id = reminder['id']
-                        user_id = reminder['user_id']
-                        content = reminder['content']
-                        # Generate the reminder notification message async
-                        notification = await asyncio.to_thread(generate_notification_message, content, user_id)
-                        # Send the notification with is_reminder_notification=True
-                        send_success = await asyncio.to_thread(reminders_send_message, user_id, notification, is_reminder_notification=True)
-                        if send_success:
-                            if await mark_reminder_sent(reminder_id):
-                                logging.info(f"✅ Sent reminder {reminder_id} to {user_id}")
-                            else:
-                                logging.error(f"❌ Sent reminder {reminder_id} but failed to mark as sent")
-                        else:
-                            logging.error(f"❌ Failed to send reminder {reminder_id} to {user_id}. Marking as sent to avoid retry loop.")
-                            await mark_reminder_sent(reminder_id)
-                            continue
-                        await asyncio.sleep(1)
-                    except Exception as e:
-                        logging.error(f"❌ Error processing reminder {reminder.get('id', 'unknown')}: {e}")
-                        logging.exception("Full traceback:")
-            await asyncio.sleep(1)
+            if not heap_loaded:
+                await load_pending_reminders()
+                heap_loaded = True
+                backlog = True
+            # Sleep until the earliest reminder is due (or a sooner one is saved);
+            # poll briefly while claimed work is still backed up
+            await reminder_heap.wait_for_next(1 if backlog else REMINDER_SWEEP_INTERVAL)
+            if stop_event.is_set():
+                break
+            # The heap only tells us when to look; the lease claim decides which
+            # process delivers, so several bot instances never double-send
+            due_locally = reminder_heap.pop_due()
+            sweep_due = time.monotonic() - last_sweep >= REMINDER_SWEEP_INTERVAL
+            if not (due_locally or sweep_due or backlog):
+                continue
+            catch_up.observe_due(due_locally)
+            capacity = delivery_pipeline.available_capacity()
+            # While catching up after downtime the claim is rate-limited and freshest first
+            limit = catch_up.claim_limit(min(capacity, REMINDER_DUE_BATCH_LIMIT))
+            claimed = []
+            if limit:
+                claimed = await claim_due_reminders(WORKER_ID, limit=limit, freshest_first=catch_up.active)
+                singles, very_late = catch_up.split_very_late(claimed)
+                for user_id, late_reminders in very_late.items():
+                    # Take the rest of this user's very late backlog now, so it goes out as one digest
+                    # instead of trickling through the rate-limited claims one reminder at a time
+                    if len(late_reminders) < CATCHUP_DIGEST_MAX_REMINDERS:
+                        late_reminders.extend(await claim_due_reminders(
+                            WORKER_ID, limit=CATCHUP_DIGEST_MAX_REMINDERS - len(late_reminders),
+                            freshest_first=True, user_id=user_id, late_by=catch_up.digest_after
+                        ))
+                    if len(late_reminders) > 1:
+                        delivery_pipeline.submit_digest(user_id, late_reminders, render_digest(late_reminders))
+                    else:
+                        singles.extend(late_reminders)
+                for reminder in singles:
+                    delivery_pipeline.submit(reminder)
+            # A full claim (or a full pipeline, or a spent rate limit) means more are waiting, so check again shortly
+            backlog = limit == 0 or len(claimed) >= limit
+            if limit:
+                catch_up.record_claim(claimed, full=len(claimed) >= limit)
+            if sweep_due:
+                # Also covers reminders saved by other processes and expired leases of crashed workers
+                last_sweep = time.monotonic()
         except Exception as e:
             # Check for MySQL connection lost error and attempt recovery
             import pymysql
@@ -84,6 +142,8 @@ async def run_scheduler_async():
                     reminders.db_pool.db_pool = None
                     await create_db_pool()
                     logging.info("🔄 Successfully reconnected to MySQL.")
+                    # Reload the heap in case reminders changed while we were disconnected
+                    heap_loaded = False
                 except Exception as pool_e:
                     logging.error(f"❌ Failed to reconnect MySQL pool: {pool_e}")
                     logging.exception("Full traceback:")
@@ -92,6 +152,81 @@ async def run_scheduler_async():
             logging.error(f"❌ Error in scheduler loop: {e}")
             logging.exception("Full traceback:")
             await asyncio.sleep(1)
+    await delivery_pipeline.stop()
+
+async def run_archiver_async():
+    """Periodically move old sent/cancelled reminders out of the hot reminders table"""
+    while reminders.db_pool.db_pool is None:
+        await asyncio.sleep(0.5)
+    while not stop_event.is_set():
+        try:
+            await archive_reminders()
+        except Exception as e:
+            # Another run (or process) will pick up whatever was left
+            logging.error(f"❌ Error archiving reminders: {e}")
+        slept = 0
+        while slept < REMINDER_ARCHIVE_INTERVAL and not stop_event.is_set():
+            await asyncio.sleep(1)
+            slept += 1
+
+def configured_notification_mode(user_id):
+    """The user's notification mode: the first guild override that applies, else NOTIFICATION_MODE"""
+    if NOTIFICATION_MODE_BY_GUILD:
+        try:
+            for guild_id in reminders_get_user_guild_ids(user_id):
+                mode = NOTIFICATION_MODE_BY_GUILD.get(str(guild_id))
+                if mode:
+                    return mode
+        except Exception as e:
+            logging.error(f"❌ Error looking up guilds for {user_id}: {e}")
+    return NOTIFICATION_MODE
+
+def render_notification_locally(reminder, pipeline):
+    """Template notification when the user's mode calls for one, otherwise None (use the LLM)"""
+    mode = configured_notification_mode(reminder['user_id'])
+    if mode == 'auto':
+        # Switch to templates while the LLM stage is backed up so delivery keeps pace
+        waiting = pipeline.queue_sizes()['generate']
+        if waiting < NOTIFICATION_TEMPLATE_QUEUE_THRESHOLD:
+            return None
+        logging.info(f"📝 {waiting} reminders waiting on the LLM; using a template for reminder {reminder['id']}")
+    elif mode != 'template':
+        return None
+    return render_template_notification(reminder['content'], reminder['id'])
+
+async def pregenerate_notifications():
+    """Write and store notification text for reminders due within the look-ahead window"""
+    upcoming = await get_upcoming_reminders_without_notification(NOTIFICATION_LOOKAHEAD_MINUTES * 60)
+    # Template-mode reminders are rendered for free at fire time
+    upcoming = [reminder for reminder in upcoming if configured_notification_mode(reminder['user_id']) != 'template']
+    stored = 0
+    for start in range(0, len(upcoming), NOTIFICATION_BATCH_SIZE):
+        batch = upcoming[start:start + NOTIFICATION_BATCH_SIZE]
+        # Anything a failed or incomplete reply leaves out is written at fire time instead
+        # (generate_notification_message's error fallback text is never stored)
+        try:
+            notifications = await asyncio.to_thread(generate_notification_batch, batch)
+        except Exception as e:
+            logging.error(f"❌ Error pre-writing batch of {len(batch)} notifications: {e}")
+            continue
+        stored += await save_reminder_notifications(notifications)
+    if stored:
+        logging.info(f"📝 Pre-wrote notifications for {stored} reminders due in the next {NOTIFICATION_LOOKAHEAD_MINUTES} minutes")
+    return stored
+
+async def run_pregeneration_async():
+    """Keep notification text ready ahead of the due time so delivery is just a Discord send"""
+    while reminders.db_pool.db_pool is None:
+        await asyncio.sleep(0.5)
+    while not stop_event.is_set():
+        try:
+            await pregenerate_notifications()
+        except Exception as e:
+            logging.error(f"❌ Error pre-writing notifications: {e}")
+        slept = 0
+        while slept < NOTIFICATION_LOOKAHEAD_INTERVAL and not stop_event.is_set():
+            await asyncio.sleep(1)
+            slept += 1
 
 def start_reminder_scheduler():
     logging.info("🔔 Starting async reminder scheduler")
@@ -99,8 +234,82 @@ def start_reminder_scheduler():
     stop_event.clear()
     loop = asyncio.get_running_loop()
     loop.create_task(run_scheduler_async())
+    loop.create_task(run_archiver_async())
+    if NOTIFICATION_LOOKAHEAD_MINUTES > 0:
+        loop.create_task(run_pregeneration_async())
     return True
 
+def _record_notification_tokens(user_id, prompt_tokens, completion_tokens):
+    # Track token usage (always call as a normal function, never as a coroutine)
+    try:
+        if inspect.iscoroutinefunction(reminders_log_token_usage):
+            asyncio.run(reminders_log_token_usage(
+                user_id,
+                MODEL,
+                prompt_tokens,
+                completion_tokens,
+                prompt_tokens + completion_tokens
+            ))
+        else:
+            reminders_log_token_usage(
+                user_id,
+                MODEL,
+                prompt_tokens,
+                completion_tokens,
+                prompt_tokens + completion_tokens
+            )
+    except Exception as e:
+        logging.error(f"❌ Error logging token usage: {e}")
+
+def generate_notification_batch(reminders):
+    """Write notifications for several due reminders in one structured-output call.
+
+    Returns:
+        dict: reminder id -> notification for every well-formed entry in the
+        reply; reminders missing from it are left to the per-reminder fallback
+    """
+    ids = {reminder['id'] for reminder in reminders}
+    response = openai.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": get_reminder_notification_batch_prompt()},
+            {"role": "user", "content": json.dumps({"reminders": [{"id": r['id'], "content": r['content']} for r in reminders]})}
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.7,
+        max_tokens=100 * len(reminders)
+    )
+    if hasattr(response, 'usage'):
+        # Split the call's tokens across the users in the batch by reminder count
+        per_user = {}
+        for reminder in reminders:
+            per_user[reminder['user_id']] = per_user.get(reminder['user_id'], 0) + 1
+        for user_id, count in per_user.items():
+            _record_notification_tokens(
+                user_id,
+                response.usage.prompt_tokens * count // len(reminders),
+                response.usage.completion_tokens * count // len(reminders)
+            )
+    result = response.choices[0].message.content.strip()
+    json_start = result.find('{')
+    json_end = result.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        logging.error(f"❌ Could not extract JSON from batch notification response: {result[:200]}")
+        return {}
+    entries = json.loads(result[json_start:json_end]).get('notifications')
+    notifications = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            reminder_id = int(entry.get('id'))
+        except (TypeError, ValueError):
+            continue
+        message = entry.get('message')
+        if reminder_id in ids and isinstance(message, str) and message.strip():
+            notifications[reminder_id] = message.strip()
+    return notifications
+
 def generate_notification_message(content, user_id=None):
     """Generate a friendly notification message"""
     try:
@@ -116,28 +325,8 @@ def generate_notification_message(content, user_id=None):
             temperature=0.7,
             max_tokens=100
         )
-        # Track token usage (always call as a normal function, never as a coroutine)
         if user_id and hasattr(response, 'usage'):
-            try:
-                if inspect.iscoroutinefunction(reminders_log_token_usage):
-                    import asyncio
-                    asyncio.run(reminders_log_token_usage(
-                        user_id,
-                        MODEL,
-                        response.usage.prompt_tokens,
-                        response.usage.completion_tokens,
-                        response.usage.prompt_tokens + response.usage.completion_tokens
-                    ))
-                else:
-                    reminders_log_token_usage(
-                        user_id,
-                        MODEL,
-                        response.usage.prompt_tokens,
-                        response.usage.completion_tokens,
-                        response.usage.prompt_tokens + response.usage.completion_tokens
-                    )
-            except Exception as e:
-                logging.error(f"❌ Error logging token usage: {e}")
+            _record_notification_tokens(user_id, response.usage.prompt_tokens, response.usage.completion_tokens)
         notification = response.choices[0].message.content.strip()
         return notification
     except Exception as e:
@@ -149,4 +338,5 @@ def stop_scheduler():
     """Stop the reminder scheduler"""
     global stop_event
     logging.info("🔔 Stopping reminder scheduler")
-    stop_event.set() 
\ No newline at end of file
+    stop_event.set()
+    reminder_heap.wake() 
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import json
 import pytz
@@ -9,7 +10,7 @@ import openai
 from config import MODEL
 
 # Import timezone utilities from reminder system
-from .reminder_handler import extract_timezone_from_location, get_user_timezone, get_any_reminder_timezone
+from .reminder_handler import extract_timezone_from_location, get_user_timezone
 
 # Common location to flag emoji mappings
 LOCATION_FLAGS = {
@@ -92,7 +93,7 @@ def _get_location_flag(location: str) -> str:
     # Default to world emoji if no match found
     return '🌎'
 
-def process_time_query(text: str, user_id: str = None) -> Tuple[str, Optional[Dict]]:
+async def process_time_query(text: str, user_id: str = None) -> Tuple[str, Optional[Dict]]:
     """
     Process a time-related query and generate a response
     
@@ -105,9 +106,7 @@ def process_time_query(text: str, user_id: str = None) -> Tuple[str, Optional[Di
     """
     try:
         # Get user's timezone from database
-        timezone = get_user_timezone(user_id)
-        if not timezone:
-            timezone = get_any_reminder_timezone(user_id)
+        timezone = await get_user_timezone(user_id)
             
         # Parse the query type
         query_type, locations = _parse_time_query(text)
@@ -135,17 +134,23 @@ def process_time_query(text: str, user_id: str = None) -> Tuple[str, Optional[Di
             reminders_send_message(recipient, "I want to make sure I give you the right time ⏰, so I just need to know where you are 🌎—mind telling me?", user_id=user_id, service=service_type)
             
             # Store reminder data while waiting for location
-            AWAITING_LOCATION[user_id] = reminder_data
+            await AWAITING_LOCATION.set(user_id, reminder_data)
             return "", None  # Return empty string instead of None
             
         if query_type == 'current_time':
             return _handle_current_time(timezone or 'UTC'), None
             
         elif query_type == 'location_time':
-            return _handle_location_time(locations[0]), None
+            # Location lookups may call the LLM, so keep them off the event loop
+            return await asyncio.to_thread(_handle_location_time, locations[0]), None
             
         elif query_type == 'time_difference':
-            return _handle_time_difference(locations[0], locations[1]), None
+            # Resolve both places concurrently; either may still need the LLM
+            timezone1, timezone2 = await asyncio.gather(
+                asyncio.to_thread(extract_timezone_from_location, locations[0]),
+                asyncio.to_thread(extract_timezone_from_location, locations[1])
+            )
+            return _handle_time_difference(locations[0], locations[1], timezone1, timezone2), None
             
         else:
             return "I couldn't understand your time query. You can ask about current time, time in a specific location, or time difference between locations.", None
@@ -248,7 +253,7 @@ def _handle_location_time(location: str) -> str:
         logging.error(f"❌ Error handling location time: {e}")
         return f"I had trouble getting the time for {formatted_location}. Please try again."
 
-def _handle_time_difference(location1: str, location2: str) -> str:
+def _handle_time_difference(location1: str, location2: str, timezone1: Optional[str], timezone2: Optional[str]) -> str:
     """Generate response for time difference between locations"""
     try:
         # Capitalize each word in the location names
@@ -259,10 +264,6 @@ def _handle_time_difference(location1: str, location2: str) -> str:
         flag1 = _get_location_flag(location1)
         flag2 = _get_location_flag(location2)
         
-        # Get timezones for both locations
-        timezone1 = extract_timezone_from_location(location1)
-        timezone2 = extract_timezone_from_location(location2)
-        
         if not timezone1 or not timezone2:
             return "I couldn't determine the timezone for one or both locations. Please try with major cities or specific timezones."
             
@@ -0,0 +1,286 @@
+import logging
+import re
+
+# Local front end for extract_reminder_details. Common phrasings ("remind me to
+# call mom in 5 minutes", "tomorrow at 5pm", "next Friday at noon") are parsed
+# here into the same {content, time, needs_timezone, timezone} structure the LLM
+# returns, with time strings process_reminder_time already understands.
+# Anything ambiguous or unusual returns None so the LLM extraction still runs.
+
+_NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11,
+    'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15, 'sixteen': 16,
+    'seventeen': 17, 'eighteen': 18, 'nineteen': 19, 'twenty': 20, 'thirty': 30,
+    'forty': 40, 'forty-five': 45, 'fifty': 50, 'sixty': 60, 'ninety': 90,
+    'a couple of': 2, 'couple of': 2, 'a couple': 2, 'a few': 3, 'few': 3
+}
+_UNITS = {
+    'sec': 'second', 'secs': 'second', 'second': 'second', 'seconds': 'second',
+    'min': 'minute', 'mins': 'minute', 'minute': 'minute', 'minutes': 'minute',
+    'hr': 'hour', 'hrs': 'hour', 'hour': 'hour', 'hours': 'hour',
+    'day': 'day', 'days': 'day', 'week': 'week', 'weeks': 'week',
+    'month': 'month', 'months': 'month', 'year': 'year', 'years': 'year'
+}
+_UNIT_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}
+_PART_OF_DAY = {'morning': (9, 'AM'), 'afternoon': (2, 'PM'), 'evening': (7, 'PM'), 'night': (9, 'PM')}
+_WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+_NUMBER = "(?:" + "|".join(sorted((re.escape(w) for w in _NUMBER_WORDS), key=len, reverse=True)) + r"|\d+)"
+_UNIT = "(?:" + "|".join(sorted(_UNITS, key=len, reverse=True)) + ")"
+_DURATION = rf"{_NUMBER}\s+{_UNIT}"
+_CLOCK = r"(?:(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>[ap]\.?\s?m\.?)?(?:\s+o'?clock)?|(?P<special>noon|midnight))"
+_PART = r"(?:in\s+the\s+|this\s+|at\s+)?(?P<part>morning|afternoon|evening|night)"
+_DAY = rf"(?:on\s+)?(?P<day>today|tonight|tomorrow|(?:the\s+)?day\s+after\s+tomorrow|(?:(?:next|this)\s+)?(?:{'|'.join(_WEEKDAYS)}))"
+
+_TRIGGER = re.compile(
+    r"\b(?:remind me|set (?:a |an )?reminder|create (?:a )?reminder|add (?:a )?reminder|make (?:a )?reminder"
+    r"|don'?t let me forget|reminder)\b",
+    re.IGNORECASE
+)
+_COURTESY = re.compile(r"^(?:hey\s+cali[,!]?\s+)?(?:(?:please|pls|can you|could you|would you|will you)\s+)*", re.IGNORECASE)
+_CONNECTOR = re.compile(r"^(?:,\s*)?(?:to|that|about|of)\s+", re.IGNORECASE)
+# Leftovers that mean the message needs the LLM: a second time, recurrence or a condition
+_LEFTOVER_TIME = re.compile(
+    rf"\b(?:\d{{1,2}}(?::\d{{2}})?\s*[ap]\.?m\b|at\s+\d|noon|midnight|today|tonight|tomorrow|{'|'.join(_WEEKDAYS)}"
+    rf"|in\s+{_DURATION}|every|each|daily|weekly|monthly|yearly|whenever|when|if|unless|until|later|soon)\b",
+    re.IGNORECASE
+)
+# Content that starts like this is really the tail of the time phrase ("in an hour
+# and a half to ...", "in 5 minutes or so to ..."), so the parsed duration is wrong
+_DURATION_QUALIFIER = re.compile(
+    r"^(?:and\s+a\s+half|and\s+a\s+quarter|and\s+change|and\s+a\s+bit|or\s+so|or\s+two|or\s+three|or\s+more|or\s+less"
+    r"|ish|give\s+or\s+take|more\s+or\s+less|at\s+most|at\s+least|tops|max|plus)\b",
+    re.IGNORECASE
+)
+_PRONOUNS = [
+    (r"\bI am\b", "you are"), (r"\bI'm\b", "you're"), (r"\bI've\b", "you've"), (r"\bI'll\b", "you'll"),
+    (r"\bI'd\b", "you'd"), (r"\bI\b", "you"), (r"\bmyself\b", "yourself"), (r"\bmine\b", "yours"),
+    (r"\bmy\b", "your"), (r"\bme\b", "you")
+]
+
+# Returned by parse_time_phrase for recognised but ambiguous times ("tomorrow", "at 8:30")
+AMBIGUOUS = object()
+
+def _number(word):
+    word = re.sub(r"\s+", " ", word)
+    return int(word) if word.isdigit() else _NUMBER_WORDS[word]
+
+def _format_relative(amount, unit):
+    return f"in {amount} {unit}{'' if amount == 1 else 's'}"
+
+def _parse_relative(p):
+    """'in 1 hour and 30 minutes', 'two days from now', 'in 3 days at 2pm' -> (time, needs_timezone)"""
+    if p == 'in half an hour':
+        return "in 30 minutes", False
+    if p in ('next week', 'a week from today', 'a week from now'):
+        return "in 7 days", False
+    if p in ('next month', 'next year'):
+        return _format_relative(1, p.split()[1]), False
+    match = re.fullmatch(
+        rf"(?:in\s+)?(?P<parts>{_DURATION}(?:\s*(?:,\s*and|,|and)\s*{_DURATION})*)(?P<from_now>\s+from\s+(?:now|today))?"
+        rf"(?:\s+(?:and\s+)?(?:at|on)\s+(?P<at>.+))?",
+        p
+    )
+    if not match or not (p.startswith('in ') or match.group('from_now')):
+        return None
+    parts = [(_number(n), _UNITS[u]) for n, u in re.findall(rf"({_NUMBER})\s+({_UNIT})", match.group('parts'))]
+    if match.group('at'):
+        # "in 3 days at 2pm" is handled by process_reminder_time's combined format
+        clock = _parse_clock(match.group('at'))
+        if len(parts) != 1 or parts[0][1] in ('second', 'minute', 'hour') or clock in (None, AMBIGUOUS) or clock[2] is None:
+            return AMBIGUOUS
+        return f"{_format_relative(*parts[0])} at {_format_clock(*clock)}", True
+    if len(parts) == 1:
+        return _format_relative(*parts[0]), False
+    units = {unit for _, unit in parts}
+    if units <= {'month', 'year'}:
+        return _format_relative(sum(n * (12 if u == 'year' else 1) for n, u in parts), 'month'), False
+    if units & {'month', 'year'}:
+        return AMBIGUOUS
+    # Compound durations collapse to their smallest unit ("1 hour and 30 minutes" -> "in 90 minutes")
+    smallest = min(units, key=_UNIT_SECONDS.get)
+    total = sum(n * _UNIT_SECONDS[u] for n, u in parts)
+    return _format_relative(total // _UNIT_SECONDS[smallest], smallest), False
+
+def _parse_clock(text):
+    """Return (hour, minute, meridiem) with meridiem None for a bare hour, AMBIGUOUS, or None if not a clock time"""
+    match = re.fullmatch(_CLOCK, text.strip())
+    if not match:
+        return None
+    if match.group('special'):
+        return (12, 0, 'PM') if match.group('special') == 'noon' else (12, 0, 'AM')
+    hour = int(match.group('hour'))
+    minute = int(match.group('minute') or 0)
+    meridiem = match.group('meridiem')
+    if minute > 59:
+        return None
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        return hour, minute, 'AM' if meridiem.startswith('a') else 'PM'
+    if 13 <= hour <= 23:
+        return hour - 12, minute, 'PM'
+    if hour == 0:
+        return 12, minute, 'AM'
+    if hour > 23:
+        return None
+    # "at 8" is resolved by process_reminder_time's own rule; "at 8:30" is left to the LLM
+    return (hour, minute, None) if not match.group('minute') else AMBIGUOUS
+
+def _format_clock(hour, minute, meridiem):
+    return f"{hour}:{minute:02d} {meridiem}"
+
+def parse_time_phrase(phrase):
+    """Parse a standalone time phrase.
+
+    Returns:
+        (time, needs_timezone), AMBIGUOUS for a recognised time that should go
+        to the LLM, or None if the phrase isn't a time expression
+    """
+    p = re.sub(r"\s+", " ", phrase.strip().lower())
+    p = re.sub(r"^(?:for|by)\s+", "", p)
+    if not p:
+        return None
+    relative = _parse_relative(p)
+    if relative is not None:
+        return relative
+
+    # Absolute: an optional day before or after an optional clock time / part of day
+    day = None
+    rest = p
+    match = re.match(rf"{_DAY}(?:\s+|$)", p)
+    if match:
+        day, rest = match.group('day'), p[match.end():]
+    else:
+        match = re.search(rf"(?:^|\s){_DAY}$", p)
+        if match:
+            day, rest = match.group('day'), p[:match.start()].strip()
+    clock = part = None
+    if rest:
+        match = re.fullmatch(rf"(?:at\s+|@\s*)?(?P<clock>.+?)(?:\s+{_PART})?", rest)
+        clock = _parse_clock(match.group('clock')) if match else None
+        if clock is not None:
+            part = match.group('part')
+            if clock is not AMBIGUOUS and clock[2] is None and not (rest.startswith(('at', '@')) or part):
+                # A bare number with no "at" ("call 3 people") isn't a time
+                return None
+        else:
+            match = re.fullmatch(_PART, rest)
+            if not match:
+                return None
+            part = match.group('part')
+    if clock is AMBIGUOUS:
+        return AMBIGUOUS
+    if day is None and clock is None and part is None:
+        return None
+
+    if day == 'tonight':
+        day, part = None, part or 'night'
+    if clock is not None and clock[2] is None:
+        if part:
+            clock = (clock[0], clock[1], 'AM' if part == 'morning' else 'PM')
+        elif day not in (None, 'today'):
+            # "tomorrow at 8" without am/pm follows the prompt's ambiguity rules
+            return AMBIGUOUS
+    if clock is None:
+        if part is not None:
+            clock = (_PART_OF_DAY[part][0], 0, _PART_OF_DAY[part][1])
+        elif day in ('tomorrow', 'today'):
+            return AMBIGUOUS
+
+    at = ""
+    if clock is not None:
+        at = f"at {clock[0]}" if clock[2] is None else f"at {_format_clock(*clock)}"
+    if day in (None, 'today'):
+        return at, True
+    if day == 'tomorrow':
+        return f"tomorrow {at}", True
+    if 'after' in day:
+        # process_reminder_time only knows the bare form; with a time it needs the combined format
+        return (f"in 2 days {at}" if at else "the day after tomorrow"), True
+    weekday = day.split()[-1].capitalize()
+    prefix = "next " if day.startswith('next') else ""
+    return f"{prefix}{weekday} {at}".strip(), True
+
+def _scan(tokens, from_end):
+    """Find the longest run of tokens at one end that parses as a time phrase"""
+    for size in range(len(tokens), 0, -1):
+        chunk = tokens[-size:] if from_end else tokens[:size]
+        parsed = parse_time_phrase(" ".join(chunk).rstrip(','))
+        if parsed is not None:
+            remaining = tokens[:-size] if from_end else tokens[size:]
+            return parsed, remaining
+    return None, tokens
+
+def _second_person(content):
+    for pattern, replacement in _PRONOUNS:
+        content = re.sub(pattern, replacement, content, flags=re.IGNORECASE)
+    return content
+
+def extract_reminder_details_locally(text):
+    """Parse a clear-cut reminder request without the LLM; returns None when unsure
+
+    >>> extract_reminder_details_locally("remind me in 5 minutes to stretch")["time"]
+    'in 5 minutes'
+    >>> extract_reminder_details_locally("remind me in an hour and a half to stretch") is None
+    True
+    >>> extract_reminder_details_locally("remind me in an hour or so to stretch") is None
+    True
+    >>> extract_reminder_details_locally("remind me in 5 minutes or so to check the oven") is None
+    True
+    >>> extract_reminder_details_locally("remind me in a day or two to call mom") is None
+    True
+    >>> extract_reminder_details_locally("remind me to stretch in an hour and a half") is None
+    True
+    """
+    cleaned = re.sub(r"\s+", " ", text.strip()).rstrip('.!')
+    courtesy = _COURTESY.match(cleaned).group(0)
+    cleaned = cleaned[len(courtesy):]
+    if courtesy:
+        # "Can you remind me to ...?" is a request, not a question
+        cleaned = cleaned.rstrip('?')
+    if not cleaned or '?' in cleaned:
+        return None
+    trigger = _TRIGGER.search(cleaned)
+    if not trigger:
+        return None
+
+    times = []
+    leading = cleaned[:trigger.start()].strip().rstrip(',')
+    if leading:
+        # "Tomorrow at 5pm remind me to ..." - everything before the trigger must be the time
+        parsed = parse_time_phrase(leading)
+        if parsed is None:
+            return None
+        times.append(parsed)
+
+    tokens = cleaned[trigger.end():].split()
+    if tokens and tokens[0].lower() in ('for', 'in', 'at', 'on', 'tomorrow', 'tonight', 'today', 'next'):
+        # "remind me in 5 minutes to ...", "set a reminder for 5pm to ..."
+        parsed, tokens = _scan(tokens, from_end=False)
+        if parsed is not None:
+            times.append(parsed)
+    parsed, tokens = _scan(tokens, from_end=True)
+    if parsed is not None:
+        times.append(parsed)
+
+    if len(times) != 1 or times[0] is AMBIGUOUS:
+        return None
+    time_str, needs_timezone = times[0]
+
+    if _DURATION_QUALIFIER.match(" ".join(tokens).strip(" ,-")):
+        return None
+    content = _CONNECTOR.sub("", " ".join(tokens).strip(" ,"))
+    content = re.sub(r"\s+(?:on|at|for|by)$", "", content, flags=re.IGNORECASE)
+    if not content or _LEFTOVER_TIME.search(content) or _TRIGGER.search(content):
+        return None
+
+    result = {
+        "content": _second_person(content),
+        "time": time_str,
+        "needs_timezone": needs_timezone,
+        "timezone": None
+    }
+    logging.info(f"⏰ Parsed reminder locally: {result}")
+    return result
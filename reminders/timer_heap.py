@@ -0,0 +1,127 @@
+import asyncio
+import heapq
+import logging
+import threading
+from datetime import datetime
+import pytz
+
+def _as_utc(scheduled_time):
+    """Normalise a scheduled time to an aware UTC datetime (DB rows come back naive UTC)"""
+    if scheduled_time.tzinfo is None:
+        return scheduled_time.replace(tzinfo=pytz.UTC)
+    return scheduled_time.astimezone(pytz.UTC)
+
+class ReminderTimerHeap:
+    """In-memory min-heap of pending reminders ordered by scheduled UTC time.
+
+    The scheduler sleeps until the earliest entry is due instead of polling the
+    database. save_reminder/cancel_reminder keep it up to date, and cancelled
+    entries are dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self._heap = []      # (scheduled_utc, reminder_id)
+        self._entries = {}   # reminder_id -> reminder dict for live entries only
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+
+    def attach(self, loop):
+        """Bind the heap to the scheduler's event loop so pushes can wake it up"""
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Wake the scheduler (safe to call from any thread)"""
+        if self._loop and self._wakeup and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def load(self, reminders):
+        """Replace the heap contents with the given pending reminders"""
+        with self._lock:
+            self._entries = {}
+            for reminder in reminders:
+                entry = dict(reminder, scheduled_time=_as_utc(reminder['scheduled_time']))
+                self._entries[entry['id']] = entry
+            self._heap = [(entry['scheduled_time'], reminder_id) for reminder_id, entry in self._entries.items()]
+            heapq.heapify(self._heap)
+        logging.info(f"🔔 Loaded {len(self._entries)} pending reminders into the timer heap")
+        self.wake()
+
+    def push(self, reminder):
+        """Add (or reschedule) a pending reminder"""
+        entry = dict(reminder, scheduled_time=_as_utc(reminder['scheduled_time']))
+        with self._lock:
+            existing = self._entries.get(entry['id'])
+            self._entries[entry['id']] = entry
+            if existing is not None and existing['scheduled_time'] == entry['scheduled_time']:
+                # Already queued for this time; just refresh the payload
+                return
+            heapq.heappush(self._heap, (entry['scheduled_time'], entry['id']))
+            is_new_head = self._heap[0][1] == entry['id']
+        # Only the scheduler's current deadline can change, so wake it only for a new head
+        if is_new_head:
+            self.wake()
+
+    def discard(self, reminder_id):
+        """Remove a reminder; its heap slot is skipped when it surfaces"""
+        with self._lock:
+            removed = self._entries.pop(reminder_id, None) is not None
+            # Compact once stale slots dominate so cancellations don't leak memory
+            if removed and len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+                self._heap = [(entry['scheduled_time'], reminder_id) for reminder_id, entry in self._entries.items()]
+                heapq.heapify(self._heap)
+        return removed
+
+    def _prune_head(self):
+        # Drop slots for cancelled or rescheduled reminders (caller holds the lock)
+        while self._heap:
+            scheduled_utc, reminder_id = self._heap[0]
+            entry = self._entries.get(reminder_id)
+            if entry is not None and entry['scheduled_time'] == scheduled_utc:
+                return
+            heapq.heappop(self._heap)
+
+    def next_due_time(self):
+        """Return the earliest scheduled UTC time, or None if the heap is empty"""
+        with self._lock:
+            self._prune_head()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """Pop every reminder whose scheduled time has passed, earliest first"""
+        now = now or datetime.now(pytz.UTC)
+        due = []
+        with self._lock:
+            self._prune_head()
+            while self._heap and self._heap[0][0] <= now:
+                _, reminder_id = heapq.heappop(self._heap)
+                due.append(self._entries.pop(reminder_id))
+                self._prune_head()
+        return due
+
+    async def wait_for_next(self, max_wait):
+        """Sleep until the earliest reminder is due, a new head is pushed, or max_wait elapses"""
+        next_due = self.next_due_time()
+        timeout = max_wait
+        if next_due is not None:
+            timeout = min(max_wait, max(0.0, (next_due - datetime.now(pytz.UTC)).total_seconds()))
+        if timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._wakeup.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, reminder_id):
+        with self._lock:
+            return reminder_id in self._entries
+
+# Shared heap used by the scheduler and kept in sync by reminders.db
+reminder_heap = ReminderTimerHeap()
@@ -0,0 +1,150 @@
+import time
+from collections import OrderedDict
+
+from config import SESSION_CACHE_MAX_USERS, SESSION_CACHE_MAX_BYTES, SESSION_IDLE_SECONDS
+
+class UserSession:
+    """One user's in-memory conversation state"""
+    __slots__ = ("memory", "messages", "summary", "dirty", "version", "size", "last_used", "saved", "next_seq", "saved_summary", "writing")
+
+    def __init__(self, memory, messages=None, summary=""):
+        self.memory = memory          # LlamaIndex ChatMemoryBuffer
+        self.messages = messages if messages is not None else []
+        self.summary = summary or ""
+        self.dirty = False            # Changed since it was last written to conversation_messages
+        self.version = 0              # Bumped on every change, so a write can tell if it went stale
+        self.size = 0
+        self.last_used = time.monotonic()
+        # What conversation_messages already holds: id(message) -> (message, seq), the next
+        # seq to append at, and the stored summary (None until the summary row exists)
+        self.saved = {}
+        self.next_seq = 1
+        self.saved_summary = None
+        self.writing = None           # asyncio.Event set when an in-flight write_sessions call finishes
+
+def estimate_session_size(session):
+    """Rough byte size of a session's history and summary (base64 images dominate when present)"""
+    size = len(session.summary)
+    for msg in session.messages:
+        content = msg.get("content")
+        if isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict):
+                    size += len(item.get("text") or "") + len((item.get("image_url") or {}).get("url") or "")
+        else:
+            size += len(content or "")
+        size += 64  # Role, dict and list overhead
+    return size
+
+class SessionCache:
+    """LRU of per-user sessions bounded by both user count and estimated bytes.
+
+    Replaces the separate memory/history/summary dicts in bot.py. Sessions
+    with unsaved changes are handed to flush (async (user_id, session)) before
+    they are evicted, and a session that is still being flushed is taken back
+    if its user comes back in the meantime.
+    """
+
+    def __init__(self, max_users=SESSION_CACHE_MAX_USERS, max_bytes=SESSION_CACHE_MAX_BYTES, idle_seconds=SESSION_IDLE_SECONDS, flush=None):
+        self.max_users = max(1, int(max_users))
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.flush = flush
+        self._sessions = OrderedDict()
+        self._flushing = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def get(self, user_id):
+        """Return the user's session (marking it most recently used), or None on a miss"""
+        session = self._sessions.get(user_id)
+        if session is None and user_id in self._flushing:
+            # Evicted moments ago and still being written; adopt it back rather than reload stale data
+            session = self._flushing.pop(user_id)
+            self._sessions[user_id] = session
+            self.total_bytes += session.size
+        if session is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._sessions.move_to_end(user_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def peek(self, user_id):
+        """Return the cached session without touching LRU order or counters"""
+        return self._sessions.get(user_id)
+
+    async def put(self, user_id, session):
+        old = self._sessions.pop(user_id, None)
+        if old is not None:
+            self.total_bytes -= old.size
+        session.size = estimate_session_size(session)
+        session.last_used = time.monotonic()
+        self._sessions[user_id] = session
+        self.total_bytes += session.size
+        await self._enforce_budget()
+
+    async def update(self, user_id, dirty=True):
+        """Re-measure a session after its history or summary changed"""
+        session = self._sessions.get(user_id)
+        if session is None:
+            return
+        new_size = estimate_session_size(session)
+        self.total_bytes += new_size - session.size
+        session.size = new_size
+        if dirty:
+            session.dirty = True
+            session.version += 1
+        await self._enforce_budget()
+
+    async def _evict(self, user_id):
+        session = self._sessions.pop(user_id)
+        self.total_bytes -= session.size
+        self.evictions += 1
+        if session.dirty and self.flush is not None:
+            self._flushing[user_id] = session
+            try:
+                await self.flush(user_id, session)
+            except Exception as e:
+                print(f"❌ Failed to flush session for {user_id} before eviction: {e}")
+            finally:
+                if self._flushing.get(user_id) is session:
+                    del self._flushing[user_id]
+
+    async def _enforce_budget(self):
+        # Never evict the most recently used session, even if it alone is over budget
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_users or self.total_bytes > self.max_bytes):
+            await self._evict(next(iter(self._sessions)))
+
+    async def evict_idle(self):
+        """Evict sessions unused for idle_seconds; returns how many were removed"""
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [user_id for user_id, session in self._sessions.items() if session.last_used < cutoff]
+        for user_id in idle:
+            if user_id in self._sessions:
+                await self._evict(user_id)
+        return len(idle)
+
+    def dirty_sessions(self):
+        """(user_id, session) pairs with changes not yet written"""
+        return [(user_id, session) for user_id, session in self._sessions.items() if session.dirty]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._sessions),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }